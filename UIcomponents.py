@@ -100,8 +100,10 @@ sidebar = html.Div(
             style={"margin": "10px 0"},
         ),
         dcc.Store(id="options-store", data=[]),  # Store for options
-        dcc.Store(id="container-store", data=[]),  # Store for container DataFrame
-        dcc.Store(id="items-store", data=[]),  # Store for items DataFrame
+        dcc.Store(id="upload-store"),  # Store for the id of the uploaded file (see UploadCache)
+        dcc.Store(id="container-store"),  # Store for the upload id and sheet of the container
+        dcc.Store(id="items-store"),  # Store for the upload id and sheet of the items
+        dcc.Store(id="job-store"),  # Id of the running container loading job
         dbc.Button(
             "Compute",
             id="compute-button",
@@ -109,6 +111,20 @@ sidebar = html.Div(
             className="me-1",
             style={"margin-top": "2rem"},
         ),
+        dbc.Button(
+            "Stop",
+            id="stop-button",
+            color="secondary",
+            className="me-1",
+            style={"margin-top": "2rem"},
+        ),
+        dbc.Button(
+            "Cancel",
+            id="cancel-button",
+            color="secondary",
+            className="me-1",
+            style={"margin-top": "2rem"},
+        ),
     ],
     style=SIDEBAR_STYLE,
 )
@@ -117,13 +133,14 @@ content = html.Div(
     [
         html.Div(id="output-data-upload"),
         html.H3("Result"),
-        dcc.Loading(
-            id="loading-results",
-            type="default",
-            children=html.Div(
-                id="output-data-upload-results",
-                style={"backgroundColor": "lightgray", "padding": "10px", "display":"inline-block","overflowWrap": "break-word", "wordWrap": "break-word", "text-wrap":"balance",  "maxWidth": "100%",  },
-            ),
+        html.Div(id="job-status"),
+        # convergence of the running job: best loading length by generation
+        dcc.Graph(id="convergence-graph", style={"display": "none"}),
+        # poll the state of the job while it is queued or running
+        dcc.Interval(id="job-interval", interval=1000, disabled=True),
+        html.Div(
+            id="output-data-upload-results",
+            style={"backgroundColor": "lightgray", "padding": "10px", "display":"inline-block","overflowWrap": "break-word", "wordWrap": "break-word", "text-wrap":"balance",  "maxWidth": "100%",  },
         ),
         # html.Div(id='output-data-upload-results', style={'backgroundColor': 'lightgray', 'padding': '10px'}),
         dcc.Store(id="is-valid-entry"),
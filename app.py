@@ -3,15 +3,19 @@ import pandas as pd
 import json
 import io
 import base64
+import logging
 import os
 import dash_bootstrap_components as dbc
+import plotly.graph_objects as go
 import dash
 from dash import dcc, html, Input, Output, State
 from dash.exceptions import PreventUpdate
 from dash.dependencies import Input, Output
 from random import randint
 from UIcomponents import sidebar, content
-from container_loading_metaheuristic import container_loading
+from jobs import JobQueue
+from result_cache import ResultCache
+from upload_cache import UploadCache
 
 CONTENT_STYLE = {
     "margin-left": "10rem",
@@ -25,6 +29,18 @@ app = dash.Dash(
 )
 
 server = app.server
+# Container loading jobs run in the background, at most MAX_JOBS at the same time
+job_queue = JobQueue(max_jobs=int(os.environ.get("MAX_JOBS", 2)))
+# and their results are cached on disk (shared by the job processes). The jobs have no seed, so the solver seeds
+# them from the cache key and a cached result is the one a new run would find (see container_loading)
+result_cache = ResultCache(
+    os.environ.get(
+        "RESULT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_cache")
+    ),
+    max_bytes=int(os.environ.get("RESULT_CACHE_BYTES", 100 * 2**20)),
+)
+# Uploaded workbooks are parsed once and kept on the server, the stores only hold their ids
+upload_cache = UploadCache(max_bytes=int(os.environ.get("UPLOAD_CACHE_BYTES", 200 * 2**20)))
 # Define the layout of the app
 app.layout = html.Div(
     [
@@ -34,8 +50,11 @@ app.layout = html.Div(
 )
 
 
-# Define the callback to update options in the Store
-@app.callback(Output("options-store", "data"), [Input("upload-data", "contents")])
+# Define the callback to parse the uploaded file and update options in the Store
+@app.callback(
+    [Output("options-store", "data"), Output("upload-store", "data")],
+    [Input("upload-data", "contents")],
+)
 def update_options(contents):
     if contents is None:
         raise PreventUpdate
@@ -44,13 +63,12 @@ def update_options(contents):
     decoded = base64.b64decode(content_string)
 
     try:
-        xl = pd.ExcelFile(io.BytesIO(decoded))
-        sheet_names = xl.sheet_names
-        options = [{"label": sheet, "value": sheet} for sheet in sheet_names]
-        return options
+        sheets = pd.read_excel(io.BytesIO(decoded), sheet_name=None)
+        options = [{"label": sheet, "value": sheet} for sheet in sheets]
+        return options, upload_cache.put(sheets)
     except Exception as e:
         print(f"Error updating options: {e}")
-        return []
+        return [], None
 
 
 # Define the callback to update dropdown options
@@ -75,18 +93,24 @@ def update_dropdown_options(options_data):
         Input("sheet-dropdown1", "value"),
         Input("sheet-dropdown2", "value"),
     ],
-    [State("upload-data", "filename"), State("upload-data", "contents")],
+    [State("upload-data", "filename"), State("upload-store", "data")],
 )
-def update_and_display_table(options, sheet_name1, sheet_name2, filename, contents):
+def update_and_display_table(options, sheet_name1, sheet_name2, filename, upload_id):
     if options is None:
         raise PreventUpdate
 
     try:
-        if sheet_name1 and sheet_name2 and contents:
-            content_type, content_string = contents.split(",")
-            decoded = base64.b64decode(content_string)
-            container = pd.read_excel(io.BytesIO(decoded), sheet_name=sheet_name1)
-            items = pd.read_excel(io.BytesIO(decoded), sheet_name=sheet_name2)
+        if sheet_name1 and sheet_name2 and upload_id:
+            sheets = upload_cache.get(upload_id)
+            if sheets is None:
+                return (
+                    dbc.Alert("The file is no longer available, please upload it again.", color="danger"),
+                    None,
+                    None,
+                    False,
+                )
+            container = sheets[sheet_name1]
+            items = sheets[sheet_name2]
 
             table1 = html.Div(
                 [
@@ -132,20 +156,21 @@ def update_and_display_table(options, sheet_name1, sheet_name2, filename, conten
                         color="danger",
                         className="d-flex align-items-center",
                     ),
-                    "[]",
-                    "[]",
+                    None,
+                    None,
                     is_valid_entry,
                 )
+            # the stores hold the upload id and the sheet, the data stays on the server
             return (
                 [table1, table2],
-                container.to_json(),
-                items.to_json(),
+                {"upload_id": upload_id, "sheet": sheet_name1},
+                {"upload_id": upload_id, "sheet": sheet_name2},
                 is_valid_entry,
             )
         else:
-            return html.Div(""), "[]", "[]", False
+            return html.Div(""), None, None, False
     except Exception as e:
-        return html.Div([f"Error: {str(e)}"]), "[]", "[]", False
+        return html.Div([f"Error: {str(e)}"]), None, None, False
 
 
 # Define the callback to display file name
@@ -159,27 +184,104 @@ def display_filename(filename):
 
 @app.callback(
     [
-        Output("output-data-upload-results", "children"),
+        Output("job-store", "data"),
         Output("output-data-upload", "style"),
     ],
     State("container-store", "data"),
     State("items-store", "data"),
+    State("job-store", "data"),
     [Input("compute-button", "n_clicks"), Input("is-valid-entry", "data")],
 )
-def update_output(container, items, n_clicks, isValid):
+def update_output(container, items, job_id, n_clicks, isValid):
     ctx = dash.callback_context
     if not ctx.triggered:
         raise PreventUpdate
     elif ctx.triggered[0]["prop_id"].split(".")[0] == "compute-button":
         if n_clicks is None or not (isValid):
-            return " ", {"display": "block"}
+            return None, {"display": "block"}
         else:
-            # Perform computation or handle click event here
-            json_data = container_loading(container, items)
-            return html.Pre(json_data, style={"display": "inline-block", "wordWrap": "break-word","overflowWrap": "break-word","text-wrap":"pretty","maxWidth": "100%"}), {"display": "none"}
+            sheets = upload_cache.get(container["upload_id"])
+            if sheets is None:
+                return None, {"display": "block"}
+            # Submit the computation to the job queue, its result is shown by update_job_status.
+            # A job of an earlier click is no longer needed
+            if job_id is not None:
+                job_queue.cancel(job_id)
+            job_id = job_queue.submit(
+                sheets[container["sheet"]], sheets[items["sheet"]], result_cache=result_cache
+            )
+            return job_id, {"display": "none"}
     else:
         return dash.no_update, {"display": "block" }  # Hide the div
 
+
+RESULT_STYLE = {"display": "inline-block", "wordWrap": "break-word","overflowWrap": "break-word","text-wrap":"pretty","maxWidth": "100%"}
+
+
+# Plot the best loading length by generation of a job
+def convergence_figure(history):
+    generations = [generation for generation, _, _, _ in history]
+    loading_lengths = [loading_length for _, loading_length, _, _ in history]
+    figure = go.Figure(go.Scatter(x=generations, y=loading_lengths, mode="lines+markers"))
+    evaluations, elapsed = (history[-1][2], history[-1][3]) if history else (0, 0.0)
+    figure.update_layout(
+        title=f"Best loading length ({evaluations} evaluations, {elapsed:.1f} s)",
+        xaxis_title="Generation",
+        yaxis_title="Loading length",
+        height=300,
+        margin={"t": 40, "b": 40},
+    )
+    return figure
+
+
+# Define the callback to follow the job until it finishes, showing its progress and best loading so far,
+# and to stop it (keeping its best loading) or cancel it
+@app.callback(
+    [
+        Output("job-status", "children"),
+        Output("output-data-upload-results", "children"),
+        Output("job-interval", "disabled"),
+        Output("convergence-graph", "figure"),
+        Output("convergence-graph", "style"),
+    ],
+    [
+        Input("job-store", "data"),
+        Input("job-interval", "n_intervals"),
+        Input("stop-button", "n_clicks"),
+        Input("cancel-button", "n_clicks"),
+    ],
+)
+def update_job_status(job_id, n_intervals, stop_clicks, cancel_clicks):
+    if job_id is None:
+        return "", " ", True, dash.no_update, {"display": "none"}
+    ctx = dash.callback_context
+    button = ctx.triggered[0]["prop_id"].split(".")[0] if ctx.triggered else None
+    if button == "stop-button":
+        job_queue.stop(job_id)
+    elif button == "cancel-button":
+        job_queue.cancel(job_id)
+    state, result = job_queue.status(job_id)
+    history, best_layout = job_queue.progress(job_id)
+    figure, graph_style = dash.no_update, {"display": "none"}
+    if history:
+        figure, graph_style = convergence_figure(history), {"display": "block"}
+    if state in ("queued", "running"):
+        best = html.Pre(best_layout, style=RESULT_STYLE) if best_layout else dash.no_update
+        return (
+            html.Div([dbc.Spinner(size="sm"), f" Job {job_id[:8]} is {state}"]),
+            best,
+            False,
+            figure,
+            graph_style,
+        )
+    if state == "done":
+        return "", html.Pre(result, style=RESULT_STYLE), True, figure, graph_style
+    if state == "failed":
+        return dbc.Alert(f"Job {job_id[:8]} failed: {result}", color="danger"), " ", True, figure, graph_style
+    return f"Job {job_id[:8]} {state}", " ", True, figure, graph_style
+
 # Run the app
 if __name__ == "__main__":
+    # show the statistics the solver and the job queue log
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     app.run_server(host="0.0.0.0", debug=False)
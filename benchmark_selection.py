@@ -0,0 +1,100 @@
+# Description: Benchmark of the selection strategies of the genetic algorithm on the sample instances.
+# For every instance, strategy and seed the genetic algorithm runs for a fixed number of generations, recording
+# the number of fitness evaluations (distinct packings simulated) and the best fitness after every generation.
+# The target is the best loading length found by any run on the instance, and the benchmark reports how many
+# runs reach it, the mean number of evaluations they need and the mean loading length of all runs at the end.
+# Besides the sample sheets, the "synthetic" instance has many rows of items of mixed sizes, which the initial
+# population does not solve, so the strategies differ in how fast they get to the target.
+from genetic_algorithm_grouping import *
+from container_loading_metaheuristic import dataframe_to_package_parser, items_to_packages
+from utils import read_excel
+from functools import partial
+import random
+import sys
+
+POPULATION_SIZE = 50
+NUM_GENERATIONS = 40
+MUTATION_RATE = 0.2
+SEEDS = range(5)
+STRATEGIES = [
+    ("roulette", 0),
+    ("roulette", 2),
+    ("rank", 2),
+    ("tournament", 0),
+    ("tournament", 2),
+]
+
+
+# Packages of the synthetic instance: rows of items with random sizes and quantities
+def synthetic_packages(rows=12, seed=0):
+    state = np.random.RandomState(seed)
+    return items_to_packages(
+        state.choice([600, 800, 1000, 1200], rows),
+        state.choice([400, 600, 800], rows),
+        state.choice([400, 600, 900], rows),
+        state.randint(8, 20, rows),
+    )
+
+
+# Run the genetic algorithm and return a list of (evaluations, best fitness) after every generation
+def run(packages, cheight, cdepth, cwidth, selection, elitism, seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    fitness_cache = FitnessCache()
+    fitness = partial(
+        calculate_fitness_3DContainerLoader,
+        packages=packages,
+        cheight=cheight,
+        cdepth=cdepth,
+        cwidth=cwidth,
+        cache=fitness_cache,
+        prefix_cache=PrefixCache(),
+    )
+    population = Population(PackageGroups(packages), POPULATION_SIZE)
+    trace = []
+    for generation in range(NUM_GENERATIONS + 1):
+        evolve(
+            population,
+            generation,
+            MUTATION_RATE,
+            fitness,
+            selection=SELECTION_METHODS[selection],
+            elitism=elitism,
+        )
+        trace.append((fitness_cache.misses, population.best_fitness))
+    return trace
+
+
+if __name__ == "__main__":
+    excel_file_path = sys.argv[1] if len(sys.argv) > 1 else "Sample_data0.xlsx"
+    sheets = (
+        sys.argv[2:] if len(sys.argv) > 2 else ["Ex1", "Ex2-del1", "Ex2-del2", "Ex3", "Ex4", "synthetic"]
+    )
+    data_container = read_excel(excel_file_path, "Container")
+    cheight = int(data_container["Height"][0])
+    cwidth = int(data_container["Width"][0])
+    cdepth = int(data_container["Length"][0])
+
+    for sheet in sheets:
+        if sheet == "synthetic":
+            packages = synthetic_packages()
+        else:
+            packages, _ = dataframe_to_package_parser(read_excel(excel_file_path, sheet))
+        traces = {
+            strategy: [run(packages, cheight, cdepth, cwidth, *strategy, seed) for seed in SEEDS]
+            for strategy in STRATEGIES
+        }
+        target = max(trace[-1][1] for runs in traces.values() for trace in runs)
+        print(f"{sheet}: {len(packages)} packages, target loading length {cdepth - target:.0f}")
+        for (selection, elitism), runs in traces.items():
+            evaluations = [
+                next(count for count, best_fitness in trace if best_fitness >= target)
+                for trace in runs
+                if trace[-1][1] >= target
+            ]
+            mean = f"{np.mean(evaluations):.1f}" if evaluations else "-"
+            loading_length = cdepth - np.mean([trace[-1][1] for trace in runs])
+            print(
+                f"  {selection:<10} elitism {elitism}: reached in {len(evaluations)}/{len(runs)} runs,",
+                f"mean evaluations {mean}, mean loading length {loading_length:.0f}",
+            )
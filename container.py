@@ -1,9 +1,109 @@
 import numpy as np
 import pandas as pd
+from bisect import bisect_left
 from genetic_algorithm_grouping import *
 from package import *
 
+def _last_change(changes):
+    # Index of the last True along the first axis of a boolean matrix, -1 for columns without any
+    last = changes.shape[0] - 1 - np.argmax(changes[::-1], axis=0)
+    return np.where(changes.any(axis=0), last, -1)
+
+
+# A version of the state of a PartiallyLoadedContainer (see PartiallyLoadedContainer.snapshot).
+# Only the current version has a state: the grid arrays and lists, held as attributes by its owner (the
+# container that used it last), or kept in the state dictionary while it has none. Every other version holds an
+# undo log: the changes that turn the state of the next version, closer to the current one, into its own.
+# log is where the current version records the old values it overwrites, if a version leads back to it.
+class _Version:
+    __slots__ = ("state", "owner", "changes", "next", "shared", "log")
+
+    def __init__(self, state, owner=None):
+        self.state = state
+        self.owner = owner
+        self.changes = None
+        self.next = None
+        self.shared = False
+        self.log = None
+
+
+# Apply a change of an undo log ("array", "set", "insert", "delete", "truncate" or "extend" with the name of
+# the state entry, a key and a value) to a state, and return the change that reverts it.
+# "truncate" and "extend" apply to a tuple of lists that grow together.
+def _apply_change(state, change):
+    kind, name, key, value = change
+    if kind == "array":
+        array = state[name]
+        reverse = (kind, name, key, array[key].copy())
+        array[key] = value
+        return reverse
+    if kind == "set":
+        reverse = (kind, name, key, state[name])
+        state[name] = value
+        return reverse
+    if kind == "insert":
+        state[name].insert(key, value)
+        return ("delete", name, key, None)
+    if kind == "delete":
+        return ("insert", name, key, state[name].pop(key))
+    if kind == "truncate":
+        removed = []
+        for list_name in name:
+            removed.append(state[list_name][key:])
+            del state[list_name][key:]
+        return ("extend", name, key, removed)
+    for list_name, items in zip(name, value):
+        state[list_name].extend(items)
+    return ("truncate", name, key, None)
+
+
+# Attribute of a PartiallyLoadedContainer kept in the state of its version. The owner of the current version
+# reads it as a plain attribute; any other container first takes over the state of its version.
+class _VersionedAttribute:
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, container, owner=None):
+        if container is None:
+            return self
+        container._checkout()
+        return container.__dict__[self.name]
+
+
 class PartiallyLoadedContainer:
+    # The grid arrays and lists, shared between snapshots (the dimensions and options are plain attributes).
+    # They are only modified by the methods below, which record the changes in the undo log.
+    _heights = _VersionedAttribute()
+    _width_coordinates = _VersionedAttribute()
+    _depth_coordinates = _VersionedAttribute()
+    width_index = _VersionedAttribute()
+    depth_index = _VersionedAttribute()
+    _column_steps = _VersionedAttribute()
+    _row_steps = _VersionedAttribute()
+    rows = _VersionedAttribute()
+    columns = _VersionedAttribute()
+    _size_after_compaction = _VersionedAttribute()
+    boxes = _VersionedAttribute()
+    boxes_index = _VersionedAttribute()
+    boxes_lower_corner = _VersionedAttribute()
+    boxes_upper_corner = _VersionedAttribute()
+    _state_names = (
+        "_heights",
+        "_width_coordinates",
+        "_depth_coordinates",
+        "width_index",
+        "depth_index",
+        "_column_steps",
+        "_row_steps",
+        "rows",
+        "columns",
+        "_size_after_compaction",
+        "boxes",
+        "boxes_index",
+        "boxes_lower_corner",
+        "boxes_upper_corner",
+    )
+
     def __init__(
         self,
         columns,
@@ -13,28 +113,49 @@ class PartiallyLoadedContainer:
         container_depth=70,
         container_width=100,
         container_height=2600,
+        capacity=64,
+        track_candidates=False,
+        compaction_threshold=None,
     ):
+        self._version = _Version({}, self)
         # Initialize the container's dimensions
         self.height = container_height
         self.depth = depth_coordinates[-1]
         self.width = width_coordinates[-1]
-        # Initialize the matrix for heights
-        self.height_matrix = [[0 for _ in range(columns)] for _ in range(rows)]
-
-        # Initialize arrays for width and depth coordinates
-        self.width_coordinates = [0] * rows
-        self.depth_coordinates = [0] * columns
         # Check the depth of the width coordinates array
         if len(width_coordinates) != rows:
             raise ValueError("Invalid number of width coordinates.")
         # Check the depth of the depth coordinates array
         if len(depth_coordinates) != columns:
             raise ValueError("Invalid number of depth coordinates.")
+
+        # Preallocate the matrix for heights and the arrays for width and depth coordinates.
+        # Only the first rows x columns entries are in use; the arrays grow by doubling when full.
+        self.rows = rows
+        self.columns = columns
+        row_capacity = max(rows, capacity)
+        column_capacity = max(columns, capacity)
+        self._heights = np.zeros((row_capacity, column_capacity))
+        self._width_coordinates = np.zeros(row_capacity)
+        self._depth_coordinates = np.zeros(column_capacity)
         # Set the width and depth coordinates
-        for i in range(rows):
-            self.width_coordinates[i] = width_coordinates[i]
-        for j in range(columns):
-            self.depth_coordinates[j] = depth_coordinates[j]
+        self._width_coordinates[:rows] = width_coordinates
+        self._depth_coordinates[:columns] = depth_coordinates
+        # Sorted index of the coordinates as plain lists, kept in sync with the arrays, for bisect lookups
+        self.width_index = self._width_coordinates[:rows].tolist()
+        self.depth_index = self._depth_coordinates[:columns].tolist()
+        # Optionally keep, for every column, the last row where its height differs from the previous column,
+        # and for every row the last column where its height differs from the previous row (see candidate_positions).
+        # Off by default and not used by the solvers: keeping the steps up to date costs more than the smaller
+        # candidate set saves in the batched search.
+        self.track_candidates = track_candidates
+        self._column_steps = np.full(column_capacity, -1)
+        self._row_steps = np.full(row_capacity, -1)
+        # Optionally merge redundant coordinate levels once the grid has grown by this many rows and columns.
+        # Off by default and not used by the solvers: on the sample and synthetic instances it does not speed
+        # up the search measurably, as the grids stay small.
+        self.compaction_threshold = compaction_threshold
+        self._size_after_compaction = rows + columns
 
         # Add a list of all boxes that are  loaded in the container, their index and their lower and upper corner
         self.boxes = []
@@ -42,70 +163,387 @@ class PartiallyLoadedContainer:
         self.boxes_lower_corner = []
         self.boxes_upper_corner = []
 
+    @property
+    def height_matrix(self):
+        """View of the heights of the cells in use (rows x columns)."""
+        return self._heights[: self.rows, : self.columns]
+
+    @property
+    def width_coordinates(self):
+        """View of the real width coordinates of the rows in use."""
+        return self._width_coordinates[: self.rows]
+
+    @property
+    def depth_coordinates(self):
+        """View of the real depth coordinates of the columns in use."""
+        return self._depth_coordinates[: self.columns]
+
     def get_height(self, row, column):
         """Get the height of the cargo at a specific cell."""
-        return self.height_matrix[row][column]
+        return self._heights[row, column]
 
     def set_height(self, row, column, height):
         """Set the height of the cargo at a specific cell."""
-        self.height_matrix[row][column] = height
+        self._prepare_write()
+        self._save("_heights", (row, column))
+        self._heights[row, column] = height
+        if self.track_candidates:
+            self._update_steps(row, row + 1, column, column + 1)
+
+    def find_row(self, real_width):
+        """Get the row whose interval (width_coordinates[i], width_coordinates[i + 1]] contains real_width."""
+        return max(bisect_left(self.width_index, real_width) - 1, 0)
+
+    def find_column(self, real_depth):
+        """Get the column whose interval (depth_coordinates[j], depth_coordinates[j + 1]] contains real_depth."""
+        return max(bisect_left(self.depth_index, real_depth) - 1, 0)
+
+    def set_heights(self, row_start, row_stop, column_start, column_stop, height):
+        """Set the height of the cargo in the block of cells [row_start, row_stop) x [column_start, column_stop)."""
+        self._prepare_write()
+        self._save("_heights", np.s_[row_start:row_stop, column_start:column_stop])
+        self._heights[row_start:row_stop, column_start:column_stop] = height
+        if self.track_candidates:
+            self._update_steps(row_start, row_stop, column_start, column_stop)
+
+    def _update_steps(self, row_start, row_stop, column_start, column_stop):
+        """Recompute the height steps of the rows and columns touching a changed block of cells."""
+        heights = self.height_matrix
+        # The steps of a column compare it with the previous one, so the column after the block changes too
+        start, stop = max(column_start, 1), min(column_stop + 1, self.columns)
+        if start < stop:
+            self._save("_column_steps", np.s_[start:stop])
+            self._column_steps[start:stop] = _last_change(
+                heights[:, start - 1 : stop - 1] != heights[:, start:stop]
+            )
+        start, stop = max(row_start, 1), min(row_stop + 1, self.rows)
+        if start < stop:
+            self._save("_row_steps", np.s_[start:stop])
+            self._row_steps[start:stop] = _last_change(
+                (heights[start - 1 : stop - 1] != heights[start:stop]).T
+            )
+
+    def candidate_positions(self):
+        """Get the corners (rows, columns) that can be the best lower corner of a box, in row-major order."""
+        # A corner is dominated by its neighbour in the previous column (row), which has a better score,
+        # unless a change of height between the two columns (rows) at or after the corner can make the
+        # neighbour infeasible. Corners on the far edges or at the container height cannot hold a box.
+        rows = np.arange(self.rows)[:, None]
+        columns = np.arange(self.columns)[None, :]
+        candidates = (
+            ((columns == 0) | (rows <= self._column_steps[None, : self.columns]))
+            & ((rows == 0) | (columns <= self._row_steps[: self.rows, None]))
+            & (self.height_matrix < self.height)
+        )
+        candidates[-1, :] = False
+        candidates[:, -1] = False
+        return np.nonzero(candidates)
+
+    # This scans the block, O(footprint). It only serves the position-by-position search of
+    # find_best_position(batched=False); the default batched search checks the support of all corners at once
+    # with prefix sums of the height changes (see evaluate_all_positions).
+    def is_level(self, row_start, row_stop, column_start, column_stop):
+        """Check if all cells in the block [row_start, row_stop) x [column_start, column_stop) have the same height."""
+        block = self._heights[row_start:row_stop, column_start:column_stop]
+        return block.size == 0 or block.min() == block.max()
+
+    def _grow(self, rows, columns):
+        """Make room for at least rows x columns cells, doubling the capacity when needed."""
+        row_capacity, column_capacity = self._heights.shape
+        if rows <= row_capacity and columns <= column_capacity:
+            return
+        row_capacity = max(rows, 2 * row_capacity) if rows > row_capacity else row_capacity
+        column_capacity = (
+            max(columns, 2 * column_capacity) if columns > column_capacity else column_capacity
+        )
+        heights = np.zeros((row_capacity, column_capacity))
+        heights[: self.rows, : self.columns] = self.height_matrix
+        width_coordinates = np.zeros(row_capacity)
+        width_coordinates[: self.rows] = self.width_coordinates
+        depth_coordinates = np.zeros(column_capacity)
+        depth_coordinates[: self.columns] = self.depth_coordinates
+        for name in ("_heights", "_width_coordinates", "_depth_coordinates", "_column_steps", "_row_steps"):
+            self._save(name)
+        self._heights = heights
+        self._width_coordinates = width_coordinates
+        self._depth_coordinates = depth_coordinates
+        column_steps = np.full(column_capacity, -1)
+        column_steps[: self.columns] = self._column_steps[: self.columns]
+        row_steps = np.full(row_capacity, -1)
+        row_steps[: self.rows] = self._row_steps[: self.rows]
+        self._column_steps = column_steps
+        self._row_steps = row_steps
 
     def add_width_coordinate(self, position, real_width=0.0):
         """Add a new width coordinate level (row) to the container."""
-        if position < 0 or position > len(self.width_coordinates):
+        if position < 0 or position > self.rows:
             raise ValueError("Invalid position for adding a width coordinate.")
+        self._prepare_write()
+        self._grow(self.rows + 1, self.columns)
+        self._save("_heights", np.s_[position : self.rows + 1, : self.columns])
+        self._save("_width_coordinates", np.s_[position : self.rows + 1])
+        self._save("rows")
 
-        # Insert a new row in the height matrix with default heights
-        self.height_matrix.insert(position, [0] * len(self.depth_coordinates))
+        # Shift the rows after the position one level up (numpy handles the overlapping slices)
+        self._heights[position + 1 : self.rows + 1, : self.columns] = self._heights[
+            position : self.rows, : self.columns
+        ]
+        self._width_coordinates[position + 1 : self.rows + 1] = self._width_coordinates[
+            position : self.rows
+        ]
+        self.rows += 1
 
         # Add the new row height to the width coordinates array
-        self.width_coordinates.insert(position, real_width)
+        self._width_coordinates[position] = real_width
+        self.width_index.insert(position, float(real_width))
+        self._log(("delete", "width_index", position, None))
         # replicate all height values in the new row
-        for i in range(len(self.depth_coordinates)):
-            self.height_matrix[position][i] = self.height_matrix[position - 1][i]
+        if position > 0:
+            self._heights[position, : self.columns] = self._heights[position - 1, : self.columns]
+        else:
+            self._heights[position, : self.columns] = 0
+        if self.track_candidates:
+            if position > 0:
+                # The new row copies the previous one: it has no steps and the column steps move with it
+                self._save("_row_steps", np.s_[position : self.rows])
+                self._save("_column_steps", np.s_[: self.columns])
+                self._row_steps[position + 1 : self.rows] = self._row_steps[position : self.rows - 1]
+                self._row_steps[position] = -1
+                column_steps = self._column_steps[: self.columns]
+                column_steps[column_steps >= position - 1] += 1
+            else:
+                self._update_steps(0, self.rows, 0, self.columns)
 
     def delete_width_coordinate(self, position):
         """Delete a width coordinate level (row) from the container."""
-        if position < 0 or position >= len(self.width_coordinates):
+        if position < 0 or position >= self.rows:
             raise ValueError("Invalid position for deleting a width coordinate.")
+        self._prepare_write()
+        self._save("_heights", np.s_[position : self.rows, : self.columns])
+        self._save("_width_coordinates", np.s_[position : self.rows])
+        self._save("rows")
 
-        # Delete the corresponding row from the height matrix
-        del self.height_matrix[position]
-
-        # Delete the width coordinate from the array
-        del self.width_coordinates[position]
+        # Shift the rows after the position one level down, dropping the row and its coordinate
+        self._heights[position : self.rows - 1, : self.columns] = self._heights[
+            position + 1 : self.rows, : self.columns
+        ]
+        self._width_coordinates[position : self.rows - 1] = self._width_coordinates[
+            position + 1 : self.rows
+        ]
+        self.rows -= 1
+        self._heights[self.rows, : self.columns] = 0
+        self._log(("insert", "width_index", position, self.width_index[position]))
+        del self.width_index[position]
+        if self.track_candidates:
+            self._update_steps(0, self.rows, 0, self.columns)
 
     def add_depth_coordinate(self, position, width_of_column=0.0):
         """Add a new depth coordinate level (column) to the container."""
-        if position < 0 or position > len(self.depth_coordinates):
+        if position < 0 or position > self.columns:
             raise ValueError("Invalid position for adding a depth coordinate.")
+        self._prepare_write()
+        self._grow(self.rows, self.columns + 1)
+        self._save("_heights", np.s_[: self.rows, position : self.columns + 1])
+        self._save("_depth_coordinates", np.s_[position : self.columns + 1])
+        self._save("columns")
 
-        # Insert a new column in the height matrix with default heights
-        for row in self.height_matrix:
-            row.insert(position, 0)
+        # Shift the columns after the position one level up
+        self._heights[: self.rows, position + 1 : self.columns + 1] = self._heights[
+            : self.rows, position : self.columns
+        ]
+        self._depth_coordinates[
+            position + 1 : self.columns + 1
+        ] = self._depth_coordinates[position : self.columns]
+        self.columns += 1
 
         # Add the new column width to the depth coordinates array
-        self.depth_coordinates.insert(position, width_of_column)
+        self._depth_coordinates[position] = width_of_column
+        self.depth_index.insert(position, float(width_of_column))
+        self._log(("delete", "depth_index", position, None))
         # replicate all height values in the new column
-        for i in range(len(self.width_coordinates)):
-            self.height_matrix[i][position] = self.height_matrix[i][position - 1]
+        if position > 0:
+            self._heights[: self.rows, position] = self._heights[: self.rows, position - 1]
+        else:
+            self._heights[: self.rows, position] = 0
+        if self.track_candidates:
+            if position > 0:
+                # The new column copies the previous one: it has no steps and the row steps move with it
+                self._save("_column_steps", np.s_[position : self.columns])
+                self._save("_row_steps", np.s_[: self.rows])
+                self._column_steps[position + 1 : self.columns] = self._column_steps[
+                    position : self.columns - 1
+                ]
+                self._column_steps[position] = -1
+                row_steps = self._row_steps[: self.rows]
+                row_steps[row_steps >= position - 1] += 1
+            else:
+                self._update_steps(0, self.rows, 0, self.columns)
 
     def delete_depth_coordinate(self, position):
         """Delete a depth coordinate level (column) from the container."""
-        if position < 0 or position >= len(self.depth_coordinates):
+        if position < 0 or position >= self.columns:
             raise ValueError("Invalid position for deleting a depth coordinate.")
+        self._prepare_write()
+        self._save("_heights", np.s_[: self.rows, position : self.columns])
+        self._save("_depth_coordinates", np.s_[position : self.columns])
+        self._save("columns")
+
+        # Shift the columns after the position one level down, dropping the column and its coordinate
+        self._heights[: self.rows, position : self.columns - 1] = self._heights[
+            : self.rows, position + 1 : self.columns
+        ]
+        self._depth_coordinates[position : self.columns - 1] = self._depth_coordinates[
+            position + 1 : self.columns
+        ]
+        self.columns -= 1
+        self._heights[: self.rows, self.columns] = 0
+        self._log(("insert", "depth_index", position, self.depth_index[position]))
+        del self.depth_index[position]
+        if self.track_candidates:
+            self._update_steps(0, self.rows, 0, self.columns)
 
-        # Delete the corresponding column from the height matrix
-        for row in self.height_matrix:
-            del row[position]
+    def compact(self):
+        """Merge coordinate levels (rows and columns) whose heights equal the previous level's."""
+        # A corner on such a level is always beaten by the corner on the previous level, and the footprint
+        # of any box covers the same heights with or without it, so placements do not change.
+        # The first and last levels (container walls) are always kept.
+        heights = self.height_matrix
+        keep_rows = np.ones(self.rows, dtype=bool)
+        keep_rows[1:-1] = (heights[1:-1] != heights[:-2]).any(axis=1)
+        keep_columns = np.ones(self.columns, dtype=bool)
+        keep_columns[1:-1] = (heights[:, 1:-1] != heights[:, :-2]).any(axis=0)
+        rows = int(keep_rows.sum())
+        columns = int(keep_columns.sum())
+        if rows < self.rows or columns < self.columns:
+            compacted = heights[keep_rows][:, keep_columns]
+            self._prepare_write()
+            self._save("_heights", np.s_[: self.rows, : self.columns])
+            self._save("_width_coordinates", np.s_[:rows])
+            self._save("_depth_coordinates", np.s_[:columns])
+            for name in ("rows", "columns", "width_index", "depth_index"):
+                self._save(name)
+            self._heights[: self.rows, : self.columns] = 0
+            self._heights[:rows, :columns] = compacted
+            self._width_coordinates[:rows] = self.width_coordinates[keep_rows]
+            self._depth_coordinates[:columns] = self.depth_coordinates[keep_columns]
+            self.rows = rows
+            self.columns = columns
+            self.width_index = self._width_coordinates[:rows].tolist()
+            self.depth_index = self._depth_coordinates[:columns].tolist()
+            if self.track_candidates:
+                self._update_steps(0, self.rows, 0, self.columns)
+        self._prepare_write()
+        self._save("_size_after_compaction")
+        self._size_after_compaction = self.rows + self.columns
 
-        # Delete the depth coordinate from the array
-        del self.depth_coordinates[position]
+    def compact_if_needed(self):
+        """Compact the grid if it has grown by compaction_threshold levels since the last compaction."""
+        if (
+            self.compaction_threshold is not None
+            and self.rows + self.columns - self._size_after_compaction
+            >= self.compaction_threshold
+        ):
+            self.compact()
+
+    def snapshot(self):
+        """Get a copy of the container that shares its state until either of them is modified."""
+        # Taking a snapshot is O(1). The first modification of either container branches off a new version of
+        # the state, which records the old values it overwrites in an undo log, and a container that goes back
+        # to another version replays the undo logs on the way. Branching thus costs O(changed cells).
+        clone = PartiallyLoadedContainer.__new__(PartiallyLoadedContainer)
+        clone.__dict__.update(self._plain_attributes())
+        self._version.shared = True
+        return clone
+
+    def restore(self, snapshot):
+        """Reset the container to the state of a snapshot, sharing it until the next modification."""
+        self._release()
+        self.__dict__.update(snapshot._plain_attributes())
+        self._version.shared = True
+
+    def _plain_attributes(self):
+        return {name: value for name, value in self.__dict__.items() if name not in self._state_names}
+
+    def _release(self):
+        """Hand the state back to the current version if the container owns it."""
+        version = self._version
+        if version.owner is self:
+            for name in self._state_names:
+                version.state[name] = self.__dict__.pop(name)
+            version.owner = None
+
+    def _checkout(self):
+        """Make the container the owner of its version, replaying the undo logs on the way to it."""
+        version = self._version
+        if version.owner is self:
+            return
+        if version.state is not None:
+            if version.owner is not None:
+                version.owner._release()
+        else:
+            path = []
+            while version.state is None:
+                path.append(version)
+                version = version.next
+            if version.owner is not None:
+                version.owner._release()
+            for version in reversed(path):
+                current = version.next
+                state = current.state
+                current.changes = [_apply_change(state, change) for change in reversed(version.changes)]
+                current.state = current.log = None
+                current.next = version
+                version.state = state
+                version.changes = version.next = None
+                # the previous current version now leads back to it, so it branches off on the next modification
+                version.shared = True
+        self.__dict__.update(version.state)
+        version.owner = self
+
+    def _prepare_write(self):
+        """Make the container the owner of the current version before it is modified, branching off if shared."""
+        version = self._version
+        if version.owner is not self:
+            self._checkout()
+        if version.shared:
+            branch = _Version(version.state, self)
+            version.state = version.owner = None
+            version.changes = branch.log = []
+            version.next = branch
+            self._version = branch
+
+    def _log(self, change):
+        """Record a change that reverts a modification, if a version leads back to the current one."""
+        log = self._version.log
+        if log is not None:
+            log.append(change)
+
+    def _save(self, name, key=None):
+        """Record the value of a state entry (or of a part of an array) before it is modified."""
+        log = self._version.log
+        if log is not None:
+            value = self.__dict__[name]
+            if key is None:
+                log.append(("set", name, None, value))
+            else:
+                log.append(("array", name, key, value[key].copy()))
+
+    def add_box(self, depth, width, height, lower_corner, upper_corner):
+        """Add a loaded box with its lower and upper corners (real coordinates) to the list of boxes."""
+        self._prepare_write()
+        count = len(self.boxes)
+        self._log(
+            ("truncate", ("boxes", "boxes_index", "boxes_lower_corner", "boxes_upper_corner"), count, None)
+        )
+        self.boxes_lower_corner.append(lower_corner)
+        self.boxes_upper_corner.append(upper_corner)
+        self.boxes_index.append(count)
+        self.boxes.append((depth, width, height))
 
     def display_container(self):
         """Display the container's current state, including heights."""
-        for i in range(len(self.width_coordinates)):
-            for j in range(len(self.depth_coordinates)):
+        for i in range(self.rows):
+            for j in range(self.columns):
                 print(
                     f"({self.width_coordinates[i]}, {self.depth_coordinates[j]}): {self.height_matrix[i][j]}"
                 )
@@ -115,8 +553,8 @@ class PartiallyLoadedContainer:
 def load_box(container, row, column, depth, width, height):
     """Load a box into the container at a specific position with a specific depth and height."""
     # Check the real coordinates of row and column, using the container's coordinates
-    width_of_row = container.width_coordinates[row]
-    width_of_column = container.depth_coordinates[column]
+    width_of_row = container.width_index[row]
+    width_of_column = container.depth_index[column]
     # compute the coordinates after the box is loaded
     width_of_row_after = width_of_row + width
     width_of_column_after = width_of_column + depth
@@ -126,8 +564,8 @@ def load_box(container, row, column, depth, width, height):
     real_height_after = real_height + height
     # check if the box fits in the container
     if (
-        width_of_row_after > container.width_coordinates[-1]
-        or width_of_column_after > container.depth_coordinates[-1]
+        width_of_row_after > container.width_index[-1]
+        or width_of_column_after > container.depth_index[-1]
     ):
         # do not load the box if it does not fit
         print("box does not fit")
@@ -136,39 +574,27 @@ def load_box(container, row, column, depth, width, height):
         # add box to the container and update coordinates and heights
         # First find the column and row where the upper real coordinate corner of the box is located
         # Find the column where the upper real coordinate corner of the box is located
-        for i in range(len(container.depth_coordinates)):
-            if (width_of_column_after >= container.depth_coordinates[i]) and (
-                width_of_column_after <= container.depth_coordinates[i + 1]
-            ):
-                new_column = i
-                break
+        new_column = container.find_column(width_of_column_after)
         # Find in the same way the row where the upper real coordinate corner of the box is located
-        for i in range(len(container.width_coordinates)):
-            if (width_of_row_after >= container.width_coordinates[i]) and (
-                width_of_row_after <= container.width_coordinates[i + 1]
-            ):
-                new_row = i
-                break
+        new_row = container.find_row(width_of_row_after)
         # Add a coordinate level (new_row) if necessary
-        if width_of_row_after < container.width_coordinates[new_row + 1]:
+        if width_of_row_after < container.width_index[new_row + 1]:
             container.add_width_coordinate(new_row + 1, width_of_row_after)
         # Add a coordinate level (new_column) if necessary
-        if width_of_column_after < container.depth_coordinates[new_column + 1]:
+        if width_of_column_after < container.depth_index[new_column + 1]:
             container.add_depth_coordinate(new_column + 1, width_of_column_after)
     # Update heights from in the box from row, colum to new_row and new_column
-    for i in range(row, new_row + 1):
-        for j in range(column, new_column + 1):
-            container.set_height(i, j, real_height_after)
-    # Add the real coordinate of the box to the list of lower corners
-    container.boxes_lower_corner.append((width_of_row, width_of_column, real_height))
-    # Add the real coordinate of the box to the list of upper corners
-    container.boxes_upper_corner.append(
-        (width_of_row_after, width_of_column_after, real_height_after)
+    container.set_heights(row, new_row + 1, column, new_column + 1, real_height_after)
+    # Add the box with the real coordinates of its lower and upper corners to the list of boxes
+    container.add_box(
+        depth,
+        width,
+        height,
+        (width_of_row, width_of_column, real_height),
+        (width_of_row_after, width_of_column_after, real_height_after),
     )
-    # Add the index of the box to the list of boxes
-    container.boxes_index.append(len(container.boxes_index))
-    # Add the box to the list of boxes
-    container.boxes.append((depth, width, height))
+    # Merge redundant coordinate levels if the grid has grown enough
+    container.compact_if_needed()
     return True
 
 
@@ -181,9 +607,12 @@ def evaluate_space_feasibility(container, row, column, depth, width, height):
     score = 0.0
     feasibility = True
     error_message = "No Problems Encountered"
+    # Read the coordinates from the container's sorted index; indexing numpy arrays one element at a time is slow
+    width_coordinates = container.width_index
+    depth_coordinates = container.depth_index
     # Check the real coordinates of row and column, using the container's coordinates
-    width_of_row = container.width_coordinates[row]
-    width_of_column = container.depth_coordinates[column]
+    width_of_row = width_coordinates[row]
+    width_of_column = depth_coordinates[column]
     # compute the coordinates after the box is loaded
     width_of_row_after = width_of_row + width
     width_of_column_after = width_of_column + depth
@@ -193,50 +622,35 @@ def evaluate_space_feasibility(container, row, column, depth, width, height):
     real_height_after = real_height + height
     # check if the box fits in the container
     if (
-        width_of_row_after > container.width_coordinates[-1]
-        or width_of_column_after > container.depth_coordinates[-1]
+        width_of_row_after > width_coordinates[-1]
+        or width_of_column_after > depth_coordinates[-1]
     ):
         feasibility = False
         error_message = "box does not fit"
         return feasibility, score, error_message
     else:
-        height_lower_left_corner = container.get_height(row, column)
         # check if the box is well supported by the container floor or previously loaded boxes (even height level).
         # compute the width in the integer grid coordinates, using the width coordinates and the width of the corner and the width of the corner after the box is loaded
-        row_after = 0
-        for i in range(len(container.width_coordinates)):
-            if (width_of_row_after > container.width_coordinates[i]) and (
-                width_of_row_after <= container.width_coordinates[i + 1]
-            ):
-                row_after = i
-                break
+        row_after = container.find_row(width_of_row_after)
         # compute the depth in the integer grid coordinates, using the depth coordinates and the depth of the corner and the depth of the corner after the box is loaded
-        column_after = 0
-        for i in range(len(container.depth_coordinates)):
-            if (width_of_column_after > container.depth_coordinates[i]) and (
-                width_of_column_after <= container.depth_coordinates[i + 1]
-            ):
-                column_after = i
-                break
-        # Go through all cells right below the box to be loaded and check if their height is the same
-        for i in range(row, row_after + 1):
-            for j in range(column, column_after + 1):
-                if container.get_height(i, j) != height_lower_left_corner:
-                    feasibility = False
-                    error_message = "box is not well supported by the container floor or previously loaded boxes (even height level)"
-                    return feasibility, score, error_message
+        column_after = container.find_column(width_of_column_after)
+        # Check that all cells right below the box to be loaded have the same height
+        if not container.is_level(row, row_after + 1, column, column_after + 1):
+            feasibility = False
+            error_message = "box is not well supported by the container floor or previously loaded boxes (even height level)"
+            return feasibility, score, error_message
         # check if the box exceeds the container height
         if real_height_after > container.height:
             feasibility = False
             error_message = "box exceeds the container height"
             return feasibility, score, error_message
         # check if the box exceeds the container depth
-        if width_of_column_after > container.depth_coordinates[-1]:
+        if width_of_column_after > depth_coordinates[-1]:
             feasibility = False
             error_message = "box exceeds the container depth"
             return feasibility, score, error_message
         # check if the box exceeds the container width
-        if width_of_row_after > container.width_coordinates[-1]:
+        if width_of_row_after > width_coordinates[-1]:
             feasibility = False
             error_message = "box exceeds the container width"
             return feasibility, score, error_message
@@ -247,23 +661,149 @@ def evaluate_space_feasibility(container, row, column, depth, width, height):
         return feasibility, score, error_message
 
 
+def evaluate_all_positions(container, depth, width, height, candidates=None):
+    # This function evaluates all integer corners (row, column) of the grid at once as lower corner of a box,
+    # with the same rules as evaluate_space_feasibility: the box fits in the container, it is well supported
+    # (even height level below it) and it does not exceed the container height.
+    # The function returns a boolean matrix with the feasible corners and a matrix with their scores.
+    # If candidates (arrays of rows and columns) are given, only those corners are evaluated, in that order.
+    width_coordinates = container.width_coordinates
+    depth_coordinates = container.depth_coordinates
+    heights = container.height_matrix
+    rows, columns = heights.shape
+    # compute the coordinates after the box is loaded, for every row and every column
+    width_of_row_after = width_coordinates + width
+    width_of_column_after = depth_coordinates + depth
+    # check if the box fits in the container
+    fits_width = width_of_row_after <= width_coordinates[-1]
+    fits_depth = width_of_column_after <= depth_coordinates[-1]
+    # compute the row and column of the upper corner in the integer grid coordinates
+    row_after = np.maximum(np.searchsorted(width_coordinates, width_of_row_after) - 1, 0)
+    column_after = np.maximum(np.searchsorted(depth_coordinates, width_of_column_after) - 1, 0)
+    # The box is well supported if there is no change of height between neighbouring cells below it.
+    # Count the changes inside every footprint with 2D prefix sums over the changes along rows and columns.
+    changes_along_row = np.zeros((rows + 1, columns))
+    changes_along_row[1:, 1:] = np.cumsum(
+        np.cumsum(heights[:, 1:] != heights[:, :-1], axis=0), axis=1
+    )
+    changes_along_column = np.zeros((rows, columns + 1))
+    changes_along_column[1:, 1:] = np.cumsum(
+        np.cumsum(heights[1:, :] != heights[:-1, :], axis=0), axis=1
+    )
+    if candidates is None:
+        i = np.arange(rows)[:, None]
+        j = np.arange(columns)[None, :]
+    else:
+        i, j = candidates
+    i_after = row_after[i]
+    j_after = column_after[j]
+    changes = (
+        changes_along_row[i_after + 1, j_after]
+        - changes_along_row[i, j_after]
+        - changes_along_row[i_after + 1, j]
+        + changes_along_row[i, j]
+    )
+    changes += (
+        changes_along_column[i_after, j_after + 1]
+        - changes_along_column[i, j_after + 1]
+        - changes_along_column[i_after, j]
+        + changes_along_column[i, j]
+    )
+    feasibility = (
+        fits_width[i]
+        & fits_depth[j]
+        & (changes == 0)
+        & (heights[i, j] + height <= container.height)
+    )
+    # compute the score: loading meters to be held small
+    score = width_of_column_after[j] + 0.00001 * width_of_row_after[i]
+    return feasibility, score
+
+
+# Lower bound on the score of a box that is loaded after any number of further (feasible) placements.
+# Loading boxes only raises the heights, so the box can later only be placed where the heights below its
+# footprint are already low enough today. The footprint can start at the lowest depth at a grid coordinate
+# (or the front) for some width position at a grid coordinate or ending at one.
+# Returns 10000000000, the score of an infeasible box, if there is no such footprint.
+def score_lower_bound(container, depth, width, height):
+    width_coordinates = container.width_coordinates
+    depth_coordinates = container.depth_coordinates
+    if width > width_coordinates[-1] or depth > depth_coordinates[-1]:
+        return 10000000000
+    blocked = container.height_matrix > container.height - height
+    # count the blocked cells of any block of cells with a 2D prefix sum
+    blocked_cells = np.zeros((container.rows + 1, container.columns + 1))
+    blocked_cells[1:, 1:] = np.cumsum(np.cumsum(blocked, axis=0), axis=1)
+    # candidate positions of the footprint and the cells it covers
+    x = np.unique(
+        np.clip(
+            np.concatenate((width_coordinates, width_coordinates - width)),
+            0,
+            width_coordinates[-1] - width,
+        )
+    )
+    y = depth_coordinates[depth_coordinates + depth <= depth_coordinates[-1]]
+    first_row = (np.searchsorted(width_coordinates, x, side="right") - 1)[:, None]
+    last_row = (np.searchsorted(width_coordinates, x + width) - 1)[:, None]
+    first_column = (np.searchsorted(depth_coordinates, y, side="right") - 1)[None, :]
+    last_column = (np.searchsorted(depth_coordinates, y + depth) - 1)[None, :]
+    count = (
+        blocked_cells[last_row + 1, last_column + 1]
+        - blocked_cells[first_row, last_column + 1]
+        - blocked_cells[last_row + 1, first_column]
+        + blocked_cells[first_row, first_column]
+    )
+    free = (count == 0).any(axis=0)
+    if not free.any():
+        return 10000000000
+    return y[free][0] + depth + 0.00001 * width
+
+
 # Find the best position for a box shaped item with a specific depth and height.
 # The function returns the best position (row, column) and the score.
 # The score reflects for a feasible place how well the box fits on previously loaded boxes. A blend of loading meters, and axle balance
-def find_best_position(container, depth, width, height):
+# In batched mode all corners are scored at once with evaluate_all_positions; otherwise one by one.
+# Containers that track candidates only offer the corners from candidate_positions, which give the same result.
+def find_best_position(container, depth, width, height, batched=True):
     best_score = 10000000000
     best_row = 0
     best_column = 0
+    candidates = container.candidate_positions() if container.track_candidates else None
+    if batched:
+        feasibility, score = evaluate_all_positions(
+            container, depth, width, height, candidates=candidates
+        )
+        if not feasibility.any():
+            return best_row, best_column, best_score
+        score = np.where(feasibility, score, np.inf).ravel()
+        # Among equal scores take the last corner in row-major order, as the scan below does
+        best_index = score.size - 1 - np.argmin(score[::-1])
+        if candidates is None:
+            best_row, best_column = divmod(int(best_index), container.columns)
+            return best_row, best_column, score[best_index]
+        return int(candidates[0][best_index]), int(candidates[1][best_index]), score[best_index]
+    if candidates is None:
+        candidates = np.divmod(np.arange(container.rows * container.columns), container.columns)
     # Go through all possible positions for the lower left corner of the box
-    for i in range(len(container.width_coordinates)):
-        for j in range(len(container.depth_coordinates)):
-            # Evaluate the feasibility of the position
-            feasibility, score, error_message = evaluate_space_feasibility(
-                container, i, j, depth, width, height
-            )
-            # If the position is feasible and the score is better than the best score so far, update the best score and position
-            if feasibility and score <= best_score:
-                best_score = score
-                best_row = i
-                best_column = j  # Update the best position
+    for i, j in zip(candidates[0].tolist(), candidates[1].tolist()):
+        # Evaluate the feasibility of the position
+        feasibility, score, error_message = evaluate_space_feasibility(
+            container, i, j, depth, width, height
+        )
+        # If the position is feasible and the score is better than the best score so far, update the best score and position
+        if feasibility and score <= best_score:
+            best_score = score
+            best_row = i
+            best_column = j  # Update the best position
     return best_row, best_column, best_score
+
+
+# Load a box at its best position (see find_best_position) and return its score. A box without a feasible
+# position is not loaded, and gets the score 10000000000.
+def place_box(container, depth, width, height):
+    best_row, best_column, best_score = find_best_position(container, depth, width, height)
+    if best_score >= 10000000000 or (
+        load_box(container, best_row, best_column, depth, width, height) is False
+    ):
+        return 10000000000
+    return best_score
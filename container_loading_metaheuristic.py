@@ -4,16 +4,115 @@ from container import *
 from package import *
 from utils import get_json_for_list_of_boxes
 from io import StringIO
+import logging
 
+logger = logging.getLogger(__name__)
 
-def container_loading(json_container, json_delivery):
-    data_container = pd.read_json(StringIO(json_container))
-    data_delivery = pd.read_json(StringIO(json_delivery))
+# Colors of the rows of items in the JSON format, up to 17 different colors, more colors can be added
+AVAILABLE_COLORS = [
+    "red",
+    "green",
+    "blue",
+    "yellow",
+    "purple",
+    "white",
+    "black",
+    "orange",
+    "violet",
+    "cyan",
+    "gray",
+    "pink",
+    "brown",
+    "lime",
+    "maroon",
+    "olive",
+    "navi",
+]
 
-    # Genetic Algorithm Parameters
-    POPULATION_SIZE = 50
-    NUM_GENERATIONS = 100
-    MUTATION_RATE = 0.2
+
+# Sizes of the manifests for which the "auto" solver switches from the genetic algorithm to the greedy seed
+# with a short genetic algorithm, and to the greedy construction alone
+HYBRID_THRESHOLD = 200
+GREEDY_THRESHOLD = 1000
+
+
+# Result of solve_container_loading. The loaded boxes are given in loading order as NumPy arrays, with one row
+# per box and the columns along the depth (length), width and height of the container: positions holds the lower
+# corners of the boxes and sizes their sizes. package_ids and item_types are the package and the row of the items
+# of every box, and unloaded the ids of the packages that did not fit.
+class LoadingResult:
+    def __init__(self, container_size, package_ids, item_types, positions, sizes, unloaded, chromosome, fitness):
+        self.container_size = container_size
+        self.package_ids = package_ids
+        self.item_types = item_types
+        self.positions = positions
+        self.sizes = sizes
+        self.unloaded = unloaded
+        self.chromosome = chromosome
+        self.fitness = fitness
+
+    @property
+    def loading_length(self):
+        """Length of the container used by the boxes."""
+        if len(self.positions) == 0:
+            return 0
+        return int(np.max(self.positions[:, 0] + self.sizes[:, 0]))
+
+    def to_json(self, colors=AVAILABLE_COLORS):
+        """Get the boxes in JSON format, with the color of their row of items."""
+        container_depth, container_width, container_height = self.container_size
+        return get_json_for_list_of_boxes(
+            range(len(self.package_ids)),
+            [colors[item_type] for item_type in self.item_types],
+            self.sizes,
+            # get_json_for_list_of_boxes takes the lower corners along the width, depth and height
+            self.positions[:, [1, 0, 2]],
+            cdepth=container_depth + 1,
+            cwidth=container_width + 1,
+            cheight=container_height + 1,
+        )
+
+    def __str__(self):
+        return (
+            f"LoadingResult(boxes={len(self.package_ids)}, unloaded={len(self.unloaded)}, "
+            f"loading_length={self.loading_length}, fitness={self.fitness})"
+        )
+
+
+# Solve the container loading problem without the JSON and DataFrame conversions.
+# container_size is the (length, width, height) of the container, and items the (length, width, height,
+# quantity) of every row of items, as an array or as records (dictionaries with these keys, in any case).
+# Returns a LoadingResult.
+# The solver is "ga" (genetic algorithm), "greedy" (single pass, see greedy_chromosome), "hybrid" (a genetic
+# algorithm of hybrid_generations seeded with the greedy solution) or "auto" (chosen by the number of packages).
+# Seed chromosomes, like the best loading order of an earlier version of the delivery, warm start the genetic
+# algorithm.
+# The genetic algorithm parameters can be adjusted to the instance: time_limit (seconds), stall_generations
+# and min_diversity stop the search early. With a checkpoint_path the genetic algorithm saves its state
+# periodically, and with resume it continues from there. should_stop stops it early (see genetic_algorithm).
+# progress is called after every generation with the report of genetic_algorithm, extended with the
+# LoadingResult of the best chromosome (layout) and its loading_length.
+# With a seed the NumPy random generator is seeded first, so the result can be reproduced.
+def solve_container_loading(
+    container_size,
+    items,
+    population_size=50,
+    num_generations=100,
+    mutation_rate=0.2,
+    time_limit=None,
+    stall_generations=None,
+    min_diversity=None,
+    solver="ga",
+    hybrid_generations=10,
+    seeds=None,
+    checkpoint_path=None,
+    resume=False,
+    should_stop=None,
+    progress=None,
+    seed=None,
+):
+    if seed is not None:
+        np.random.seed(seed)
 
     # draw a ASCII Graphics rectangle as a comment with depth, width, height
     # -------------------------  ---
@@ -24,105 +123,269 @@ def container_loading(json_container, json_delivery):
     # |<----    depth    ---->|  ---
 
     # Initialize the container
-    container_height = int(data_container["Height"][0])
-    container_width = int(data_container["Width"][0])
-    container_depth = int(data_container["Length"][0])
-
-    packages, list_of_colors = dataframe_to_package_parser(data_delivery)
-    # Run the genetic algorithm
-    best_chromosome, best_fitness = genetic_algorithm(
-        packages, POPULATION_SIZE, NUM_GENERATIONS, MUTATION_RATE
-    )
-    # Print the best loading order
-    print("Best Loading Order:", best_chromosome, "Fitness:", best_fitness)
+    container_depth, container_width, container_height = (int(size) for size in container_size)
 
-    # Translate the best chromosome into a list of items to be loaded in the container
-    items_to_be_loaded = []
-    color_package = []
-    for group_id, package_ids in best_chromosome.items():
-        for package_idx in package_ids:
-            package = packages[package_idx]
-            color_package.append(list_of_colors[package_idx])
-            items_to_be_loaded.append(
-                (
-                    package.width,
-                    package.height,
-                    package.depth,
-                )
+    if len(items) > 0 and isinstance(items[0], dict):
+        items = [{key.lower(): value for key, value in item.items()} for item in items]
+        items = [[item["length"], item["width"], item["height"], item["quantity"]] for item in items]
+    items = np.asarray(items).reshape(-1, 4)
+    packages = items_to_packages(items[:, 0], items[:, 1], items[:, 2], items[:, 3])
+    if solver == "auto":
+        if len(packages) >= GREEDY_THRESHOLD:
+            solver = "greedy"
+        elif len(packages) >= HYBRID_THRESHOLD:
+            solver = "hybrid"
+        else:
+            solver = "ga"
+    if solver not in ("ga", "greedy", "hybrid"):
+        raise ValueError(f"Unknown solver: {solver}")
+
+    if solver in ("greedy", "hybrid"):
+        best_chromosome = greedy_chromosome(packages)
+        best_fitness = evaluate_chromosome(
+            best_chromosome, packages, container_height, container_depth, container_width
+        )
+        logger.info("Greedy loading order: %s fitness: %s", best_chromosome, best_fitness)
+    # the boxes of the best chromosome are only loaded again when it improves
+    best_layout = [None, None]
+
+    def report_progress(report):
+        if report["best_fitness"] != best_layout[0]:
+            best_layout[0] = report["best_fitness"]
+            best_layout[1] = load_chromosome(
+                report["best_chromosome"],
+                packages,
+                container_height,
+                container_width,
+                container_depth,
+                report["best_fitness"],
             )
-            
-    container = PartiallyLoadedContainer(
-        2, 2, [0, container_depth], [0, container_width]
+        progress(
+            dict(
+                report,
+                loading_length=best_layout[1].loading_length,
+                layout=best_layout[1],
+            )
+        )
+
+    if solver in ("ga", "hybrid"):
+        if solver == "hybrid":
+            seeds = [best_chromosome] + list(seeds or [])
+        # Run the genetic algorithm
+        chromosome, fitness = genetic_algorithm(
+            packages,
+            population_size,
+            num_generations if solver == "ga" else hybrid_generations,
+            mutation_rate,
+            cheight=container_height,
+            cdepth=container_depth,
+            cwidth=container_width,
+            time_limit=time_limit,
+            stall_generations=stall_generations,
+            min_diversity=min_diversity,
+            seeds=seeds,
+            checkpoint_path=checkpoint_path,
+            resume=resume,
+            should_stop=should_stop,
+            progress=None if progress is None else report_progress,
+        )
+        if solver == "ga" or fitness > best_fitness:
+            best_chromosome, best_fitness = chromosome, fitness
+    # Print the best loading order
+    logger.info("Best loading order: %s fitness: %s", best_chromosome, best_fitness)
+
+    return load_chromosome(
+        best_chromosome,
+        packages,
+        container_height,
+        container_width,
+        container_depth,
+        best_fitness,
     )
-    container.height = container_height
 
-    # Load the boxes in the container
-    for box in items_to_be_loaded:
-        depth, width, height = box
-        best_row, best_column, best_score = find_best_position(
-            container, depth, width, height
+
+# Solve the container loading problem for a container and a delivery, and return the boxes in JSON format.
+# json_container and json_delivery are DataFrames (with the columns of the Container and the items sheets) or
+# their JSON strings (DataFrame.to_json); the names are kept for the callers that pass them by keyword.
+# The parameters are those of solve_container_loading, except that the progress reports get the boxes of the
+# best chromosome in JSON format (boxes_json) instead of its LoadingResult.
+# With a result_cache (see ResultCache) the result of the same container, delivery, parameters and seed is
+# reused; results of runs stopped by should_stop are not cached. Runs without a seed are then seeded from the
+# cache key, so the cached result is not the result of one random run but that of a fixed seed.
+def container_loading(
+    json_container,
+    json_delivery,
+    population_size=50,
+    num_generations=100,
+    mutation_rate=0.2,
+    time_limit=None,
+    stall_generations=None,
+    min_diversity=None,
+    solver="ga",
+    hybrid_generations=10,
+    seeds=None,
+    checkpoint_path=None,
+    resume=False,
+    should_stop=None,
+    progress=None,
+    seed=None,
+    result_cache=None,
+):
+    data_container = json_container
+    if not isinstance(data_container, pd.DataFrame):
+        data_container = pd.read_json(StringIO(json_container))
+    data_delivery = json_delivery
+    if not isinstance(data_delivery, pd.DataFrame):
+        data_delivery = pd.read_json(StringIO(json_delivery))
+
+    container_size = (
+        data_container["Length"][0],
+        data_container["Width"][0],
+        data_container["Height"][0],
+    )
+    items = data_delivery[["Length", "Width", "Height", "Quantity"]].to_numpy()
+    parameters = {
+        "population_size": population_size,
+        "num_generations": num_generations,
+        "mutation_rate": mutation_rate,
+        "time_limit": time_limit,
+        "stall_generations": stall_generations,
+        "min_diversity": min_diversity,
+        "solver": solver,
+        "hybrid_generations": hybrid_generations,
+        "seeds": seeds,
+        "seed": seed,
+    }
+    if result_cache is not None:
+        # only the data that the result depends on is part of the key
+        key = result_cache.key(
+            data_container[["Length", "Width", "Height"]].values[0].tolist(),
+            items.tolist(),
+            parameters,
         )
-        load_box(container, best_row, best_column, depth, width, height)
-
-    # Make a list of boxes in JSON format
-    # Assign same colors to same size boxes
-    boxes_json = get_json_for_list_of_boxes(
-        container.boxes_index,
-        color_package,
-        container.boxes,
-        container.boxes_lower_corner,
-        cdepth=container_depth + 1,
-        cwidth=container_width + 1,
-        cheight=container_height + 1,
+        boxes_json = result_cache.get(key)
+        logger.info("Result cache hits: %d misses: %d", result_cache.hits, result_cache.misses)
+        if boxes_json is not None:
+            return boxes_json
+        # without a seed, the cached result is that of a seed derived from the key, so it can be reproduced
+        if seed is None:
+            parameters["seed"] = int(key[:8], 16)
+
+    # the layout of the best chromosome is only converted again when it changes
+    best_layout = [None, None]
+
+    def report_progress(report):
+        if report["layout"] is not best_layout[0]:
+            best_layout[0] = report["layout"]
+            best_layout[1] = report["layout"].to_json()
+        report = dict(report, boxes_json=best_layout[1])
+        del report["layout"]
+        progress(report)
+
+    result = solve_container_loading(
+        container_size,
+        items,
+        checkpoint_path=checkpoint_path,
+        resume=resume,
+        should_stop=should_stop,
+        progress=None if progress is None else report_progress,
+        **parameters,
     )
+    boxes_json = result.to_json()
+    if result_cache is not None and not (should_stop is not None and should_stop()):
+        result_cache.put(key, boxes_json)
     return boxes_json
 
 
+# Greedy construction of a chromosome: the groups are loaded by decreasing footprint of their largest box,
+# then by decreasing volume, and so are the packages within each group.
+# A box of a package occupies package.width along the depth and package.height along the width of the container
+def greedy_chromosome(packages):
+    def size_key(package_idx):
+        package = packages[package_idx]
+        footprint = package.width * package.height
+        return (footprint, footprint * package.depth)
+
+    groups = {}
+    for package in packages:
+        groups.setdefault(package.group_id, []).append(package.item_id)
+    for package_ids in groups.values():
+        package_ids.sort(key=size_key, reverse=True)
+    order = sorted(groups, key=lambda group_id: size_key(groups[group_id][0]), reverse=True)
+    return {group_id: groups[group_id] for group_id in order}
+
+
+# Load the packages of a chromosome in a container, in order, and return the LoadingResult
+def load_chromosome(
+    chromosome, packages, container_height, container_width, container_depth, fitness=None
+):
+    # Translate the best chromosome into a list of items to be loaded in the container
+    package_order = [package_idx for package_ids in chromosome.values() for package_idx in package_ids]
+
+    container = PartiallyLoadedContainer(
+        2,
+        2,
+        [0, container_depth],
+        [0, container_width],
+        capacity=len(package_order) + 2,
+    )
+    container.height = container_height
+
+    # Load the boxes in the container
+    loaded = []
+    unloaded = []
+    for package_idx in package_order:
+        package = packages[package_idx]
+        depth, width, height = package.width, package.height, package.depth
+        # loaded as in the fitness simulation (see simulate_loading), which leaves out the boxes that do not fit
+        if place_box(container, depth, width, height) >= 10000000000:
+            unloaded.append(package_idx)
+        else:
+            loaded.append(package_idx)
+
+    # the lower corners are kept along the width, depth and height of the container
+    lower_corners = np.array(container.boxes_lower_corner, dtype=int).reshape(-1, 3)
+    return LoadingResult(
+        (container_depth, container_width, container_height),
+        np.array(loaded, dtype=int),
+        np.array([packages[package_idx].group_id for package_idx in loaded], dtype=int),
+        lower_corners[:, [1, 0, 2]],
+        np.array(container.boxes, dtype=int).reshape(-1, 3),
+        np.array(unloaded, dtype=int),
+        chromosome,
+        fitness,
+    )
 
-def dataframe_to_package_parser(df):
-    l0 = df["Length"].to_numpy()
-    w0 = df["Width"].to_numpy()
-    h0 = df["Height"].to_numpy()
-    quantity = df["Quantity"].to_numpy()
-    wgt0 = df["Weight"].to_numpy()
-    type0 = df["Type"]
-    available_colors = [
-        "red",
-        "green",
-        "blue",
-        "yellow",
-        "purple",
-        "white",
-        "black",
-        "orange",
-        "violet",
-        "cyan",
-        "gray",
-        "pink",
-        "brown",
-        "lime",
-        "maroon",
-        "olive",
-        "navi",
-    ]  # up to 17 different colors, more colors can be added
 
+# Make a package for every item of every row (group) of items, given the length, width, height and quantity of
+# the rows
+def items_to_packages(lengths, widths, heights, quantities):
     packages = []
-    list_of_colors = []
     item_id = 0
 
-    for i in range(len(l0)):
-        for _ in range(quantity[i]):
+    for i in range(len(lengths)):
+        for _ in range(int(quantities[i])):
             packages.append(
                 Package(
                     item_id=item_id,
-                    width=w0[i],
-                    height=l0[i],
-                    depth=h0[i],
+                    width=widths[i],
+                    height=lengths[i],
+                    depth=heights[i],
                     non_stackable=False,
                     group_id=i,
                 )
             )
-            list_of_colors.append(available_colors[i])
             item_id = item_id + 1
 
+    return packages
+
+
+def dataframe_to_package_parser(df):
+    packages = items_to_packages(
+        df["Length"].to_numpy(),
+        df["Width"].to_numpy(),
+        df["Height"].to_numpy(),
+        df["Quantity"].to_numpy(),
+    )
+    list_of_colors = [AVAILABLE_COLORS[package.group_id] for package in packages]
     return packages, list_of_colors
@@ -1,6 +1,19 @@
+import copy
+import logging
 import numpy as np
-import random
-from container import PartiallyLoadedContainer, find_best_position, load_box
+import os
+import pickle
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from container import (
+    PartiallyLoadedContainer,
+    place_box,
+    score_lower_bound,
+)
 from package import *
 
 # import all local files
@@ -9,6 +22,8 @@ from package import *
 # In debug mode, the process of loading is documented with print statements on the console
 # test_load_box()
 
+logger = logging.getLogger(__name__)
+
 
 def print_population(population):
     for solution in population:
@@ -25,81 +40,829 @@ def get_group_ids(group):
     return ids
 
 
-# Initialize population with random permutations
-def initialize_population(population_size, packages):
-    population = []
-    for _ in range(population_size):
-        solution = {}
-        grouped_packages = {}
+# Layout of the packages by group for the array encoding of the population.
+# A population is a pair of integer matrices: group_orders (population x groups) holds the order in which
+# the groups are loaded, and package_orders (population x packages) the package ids of group g in
+# columns offsets[g]:offsets[g + 1], in the order they are loaded.
+class PackageGroups:
+    def __init__(self, packages):
+        members = {}
         for package in packages:
-            if package.group_id not in grouped_packages:
-                grouped_packages[package.group_id] = []
-            grouped_packages[package.group_id].append(package.item_id)
-        for group_id, group_packages in grouped_packages.items():
-            random.shuffle(group_packages)
-            solution[group_id] = group_packages
-        population.append(solution)
-    return population
-
-
-def calculate_fitness_3DContainerLoader(population, packages, cheight, cdepth, cwidth):
-    fitness_scores = []
-
-    for chromosome in population:
-        # make a list of items to be loaded in the container by putting packages in the order of the chromosome
-        items_to_be_loaded = []
-        for group_id, package_ids in chromosome.items():
-            for package_idx in package_ids:
-                package = packages[package_idx]
-                items_to_be_loaded.append(
-                    (
-                        package.width,
-                        package.height,
-                        package.depth,
-                    )
+            members.setdefault(package.group_id, []).append(package.item_id)
+        self.group_ids = list(members)
+        self.package_ids = np.array(
+            [package_idx for group_id in self.group_ids for package_idx in members[group_id]],
+            dtype=int,
+        )
+        self.counts = np.array([len(members[group_id]) for group_id in self.group_ids], dtype=int)
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)))
+        self.column_groups = np.repeat(np.arange(len(self.group_ids)), self.counts)
+        # number the distinct box sizes, so the runs of a loading order can be found on integers
+        self.sizes = []
+        size_numbers = {}
+        self.size_of_package = np.zeros(len(packages), dtype=int)
+        for package_idx, package in enumerate(packages):
+            size = (package.width, package.height, package.depth)
+            if size not in size_numbers:
+                size_numbers[size] = len(self.sizes)
+                self.sizes.append(size)
+            self.size_of_package[package_idx] = size_numbers[size]
+        # groups with boxes of different sizes, the only ones whose package order changes the packing
+        self.mixed = np.array(
+            [
+                len(set(self.size_of_package[self.package_ids[start:stop]].tolist())) > 1
+                for start, stop in zip(self.offsets[:-1], self.offsets[1:])
+            ],
+            dtype=bool,
+        )
+
+    def load_orders(self, group_orders, package_orders):
+        """Get the package ids of every chromosome in loading order (population x packages)."""
+        # position of the first package of every group in the loading order
+        starts = np.zeros(group_orders.shape, dtype=int)
+        ordered_counts = self.counts[group_orders]
+        np.put_along_axis(
+            starts, group_orders, np.cumsum(ordered_counts, axis=1) - ordered_counts, axis=1
+        )
+        columns = np.arange(len(self.column_groups))
+        targets = starts[:, self.column_groups] + (columns - self.offsets[self.column_groups])
+        orders = np.empty_like(package_orders)
+        np.put_along_axis(orders, targets, package_orders, axis=1)
+        return orders
+
+    def signatures(self, orders):
+        """Get the dimension signature (see dimension_signature) of every loading order."""
+        size_orders = self.size_of_package[orders]
+        signatures = []
+        for size_order in size_orders:
+            starts = np.flatnonzero(np.diff(size_order, prepend=-1))
+            counts = np.diff(starts, append=len(size_order))
+            signatures.append(
+                tuple(
+                    (self.sizes[size], count)
+                    for size, count in zip(size_order[starts].tolist(), counts.tolist())
                 )
+            )
+        return signatures
+
+    def encode(self, chromosome):
+        """Get the group order and package order of a chromosome, repaired to fit these packages."""
+        # groups that no longer exist are dropped and new groups are loaded last; within a group, the packages
+        # of the chromosome that still belong to it keep their order and the new packages follow
+        group_numbers = {group_id: group for group, group_id in enumerate(self.group_ids)}
+        group_order = [group_numbers[group_id] for group_id in chromosome if group_id in group_numbers]
+        group_order += [group for group in range(len(self.group_ids)) if group not in group_order]
+        package_order = self.package_ids.copy()
+        for group_id, package_ids in chromosome.items():
+            if group_id not in group_numbers:
+                continue
+            group = group_numbers[group_id]
+            members = package_order[self.offsets[group] : self.offsets[group + 1]].tolist()
+            kept = list(dict.fromkeys(package_idx for package_idx in package_ids if package_idx in members))
+            package_order[self.offsets[group] : self.offsets[group + 1]] = kept + [
+                package_idx for package_idx in members if package_idx not in kept
+            ]
+        return np.array(group_order, dtype=int), package_order
+
+    def chromosome(self, group_order, package_order):
+        """Get a chromosome of the population as a dictionary of package ids by group, in loading order."""
+        return {
+            self.group_ids[group]: package_order[
+                self.offsets[group] : self.offsets[group + 1]
+            ].tolist()
+            for group in group_order
+        }
+
+
+# Initialize population with random permutations
+# The groups are loaded in the order of group_orders, so the order of the groups is shuffled as well.
+# Seed chromosomes (dictionaries of package ids by group, e.g. an earlier solution) are repaired to fit the
+# packages (see PackageGroups.encode) and start the population, followed by mutated copies of them, with at
+# least one swap of two groups each, up to half of the population.
+def initialize_population(population_size, groups, seeds=None, mutation_rate=0.2):
+    number_of_groups = len(groups.group_ids)
+    group_orders = np.argsort(np.random.random((population_size, number_of_groups)), axis=1)
+    # random keys within [g, g + 1) keep every package in the columns of its group g
+    keys = groups.column_groups + np.random.random((population_size, len(groups.column_groups)))
+    package_orders = groups.package_ids[np.argsort(keys, axis=1)]
+    if seeds:
+        encoded = [groups.encode(seed) for seed in seeds[:population_size]]
+        count = max(len(encoded), population_size // 2)
+        copies = np.arange(count) % len(encoded)
+        group_orders[:count] = np.array([group_order for group_order, _ in encoded])[copies]
+        package_orders[:count] = np.array([package_order for _, package_order in encoded])[copies]
+        mutate(
+            group_orders[len(encoded) : count],
+            package_orders[len(encoded) : count],
+            mutation_rate,
+            groups,
+        )
+        # only the group order changes the packing of most groups, so every copy gets a swap of two groups
+        if number_of_groups > 1:
+            swap_groups(group_orders, np.arange(len(encoded), count))
+    return group_orders, package_orders
+
+
+def evaluate_chromosome(chromosome, packages, cheight, cdepth, cwidth, prefix_cache=None):
+    return simulate_loading(
+        dimension_signature(chromosome, packages), cheight, cdepth, cwidth, prefix_cache
+    )
 
+
+# Simulate the loading of the boxes of a dimension signature and return the fitness score.
+# A trail, if given, receives the (container snapshot, score) state after each run of boxes. It may come
+# pre-filled with the states of a parent that shares the first runs, and the simulation resumes from there.
+# With a prefix cache the simulation resumes from the longest prefix of the signature loaded before.
+# With a cutoff fitness every fitness below it is reported as pruned_fitness(cutoff), so the result does not
+# depend on where the simulation resumed; it stops after a run of boxes once a bound on the score of the last
+# box shows the fitness cannot reach the cutoff.
+def simulate_loading(
+    signature, cheight, cdepth, cwidth, prefix_cache=None, trail=None, cutoff=None
+):
+    start = len(trail) if trail else 0
+    state = trail[-1] if trail else None
+    if prefix_cache is not None:
+        cached_start, cached_state = prefix_cache.longest_prefix(signature)
+        if cached_start > start:
+            start, state = cached_start, cached_state
+            if trail is not None:
+                # the states of the runs in between are unknown
+                trail.extend([None] * (start - 1 - len(trail)))
+                trail.append(state)
+    if state is None:
         # initialize the container
         container = PartiallyLoadedContainer(2, 2, [0, cdepth], [0, cwidth])
         container.height = cheight
-
-        # load the boxes in the container
         best_score = 10000000000
-        for box in items_to_be_loaded:
-            depth, width, height = box
-            best_row, best_column, best_score = find_best_position(
-                container, depth, width, height
+    else:
+        # branch off the cached container; its state is only copied when the next box is loaded
+        snapshot, best_score = state
+        container = snapshot.snapshot()
+
+    # load the boxes in the container
+    for position in range(start, len(signature)):
+        (depth, width, height), count = signature[position]
+        for _ in range(count):
+            best_score = place_box(container, depth, width, height)
+        state = (container.snapshot(), best_score)
+        if prefix_cache is not None:
+            prefix_cache.store(signature[: position + 1], state)
+        if trail is not None:
+            trail.append(state)
+        # boxes without a feasible position are not loaded, so the heights only rise as the bound needs
+        if cutoff is not None and position < len(signature) - 1:
+            (depth, width, height), count = signature[-1]
+            bound = score_lower_bound(container, depth, width, height)
+            if container.depth - bound < cutoff:
+                return pruned_fitness(cutoff)
+    # calculate the fitness score
+    fitness = container.depth - best_score
+    if cutoff is not None and fitness < cutoff:
+        return pruned_fitness(cutoff)
+    return fitness
+
+
+# Fitness of the simulations that cannot reach a cutoff: the largest value below it, so they rank below
+# every simulation that reaches it
+def pruned_fitness(cutoff):
+    return np.nextafter(cutoff, -np.inf)
+
+
+# Number of leading runs of boxes two dimension signatures have in common
+def first_difference(signature, other):
+    shared = 0
+    for run, other_run in zip(signature, other):
+        if run != other_run:
+            break
+        shared += 1
+    return shared
+
+
+# The part of a parent's trail a child can resume from: the states up to the last known one among
+# the runs both signatures share (the trail of a simulation stopped early is shorter than its signature)
+def _shared_trail(signature, parent_signature, parent_trail):
+    shared = min(first_difference(signature, parent_signature), len(parent_trail))
+    while shared > 0 and parent_trail[shared - 1] is None:
+        shared -= 1
+    return parent_trail[:shared]
+
+
+class _PrefixNode:
+    __slots__ = ("parent", "key", "children", "state")
+
+    def __init__(self, parent=None, key=None):
+        self.parent = parent
+        self.key = key
+        self.children = {}
+        self.state = None
+
+
+# Trie of partially loaded containers keyed by the runs of box sizes loaded so far, so that simulations
+# sharing a leading run of boxes start from the container state after it. At most max_snapshots states
+# are kept; the least recently used one is dropped first.
+class PrefixCache:
+    def __init__(self, max_snapshots=1000):
+        self.max_snapshots = max_snapshots
+        self.hits = 0
+        self.misses = 0
+        self._root = _PrefixNode()
+        self._snapshots = OrderedDict()
+
+    def longest_prefix(self, signature):
+        """Get the length of the longest cached prefix of a signature and its (container, score) state."""
+        node = self._root
+        length, best = 0, None
+        for position, key in enumerate(signature):
+            node = node.children.get(key)
+            if node is None:
+                break
+            if node.state is not None:
+                length, best = position + 1, node
+        if best is None:
+            self.misses += 1
+            return 0, None
+        self.hits += 1
+        self._snapshots.move_to_end(best)
+        return length, best.state
+
+    def store(self, prefix, state):
+        """Store the (container, score) state after loading the runs of a signature prefix."""
+        if self.max_snapshots <= 0:
+            return
+        node = self._root
+        for key in prefix:
+            child = node.children.get(key)
+            if child is None:
+                child = node.children[key] = _PrefixNode(node, key)
+            node = child
+        node.state = state
+        self._snapshots[node] = None
+        self._snapshots.move_to_end(node)
+        while len(self._snapshots) > self.max_snapshots:
+            evicted, _ = self._snapshots.popitem(last=False)
+            evicted.state = None
+            # drop the branch up to the first node that is still needed
+            while evicted.parent is not None and not evicted.children and evicted.state is None:
+                del evicted.parent.children[evicted.key]
+                evicted = evicted.parent
+
+    def __len__(self):
+        return len(self._snapshots)
+
+
+# The sequence of box sizes loaded by a chromosome as a hashable key, with runs of equal sizes collapsed
+# to (size, count). Packages of a group share their size, so shuffling a group does not change the
+# signature, and chromosomes with the same signature produce the same packing and fitness.
+def dimension_signature(chromosome, packages):
+    signature = []
+    for package_ids in chromosome.values():
+        for package_idx in package_ids:
+            package = packages[package_idx]
+            size = (package.width, package.height, package.depth)
+            if signature and signature[-1][0] == size:
+                signature[-1][1] += 1
+            else:
+                signature.append([size, 1])
+    return tuple((size, count) for size, count in signature)
+
+
+# Bounded cache of fitness scores by dimension signature, evicting the least recently used entry.
+# Pruned scores (see pruned_fitness) are stored with the cutoff they were computed with, and only serve
+# lookups with the same or a higher cutoff.
+class FitnessCache:
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+
+    def get(self, key, cutoff=None):
+        """Get the cached score of a signature under a cutoff, or None on a miss."""
+        entry = self._scores.get(key)
+        if entry is None or (entry[1] is not None and (cutoff is None or cutoff < entry[1])):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._scores.move_to_end(key)
+        score = entry[0]
+        if cutoff is not None and score < cutoff:
+            return pruned_fitness(cutoff)
+        return score
+
+    def put(self, key, score, cutoff=None):
+        """Store the score of a signature computed under a cutoff, evicting the least recently used one if full."""
+        if self.maxsize <= 0:
+            return
+        self._scores[key] = (score, cutoff if cutoff is not None and score < cutoff else None)
+        self._scores.move_to_end(key)
+        if len(self._scores) > self.maxsize:
+            self._scores.popitem(last=False)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __str__(self):
+        return f"FitnessCache(size={len(self)}, hits={self.hits}, misses={self.misses})"
+
+
+# Container dimensions and prefix cache of a fitness worker process, set once by _initialize_worker
+_worker_arguments = None
+
+
+def _initialize_worker(cheight, cdepth, cwidth, prefix_snapshots):
+    global _worker_arguments
+    prefix_cache = PrefixCache(prefix_snapshots) if prefix_snapshots > 0 else None
+    _worker_arguments = (cheight, cdepth, cwidth, prefix_cache)
+
+
+def _evaluate_in_worker(signature, cutoff=None):
+    return simulate_loading(signature, *_worker_arguments, cutoff=cutoff)
+
+
+# Create a process pool for the fitness evaluation, or None to evaluate serially (workers is None or 1).
+# The workers receive the container dimensions and set up their own prefix cache once, so only the
+# dimension signatures are sent every generation.
+def create_fitness_executor(workers, cheight, cdepth, cwidth, prefix_snapshots=0):
+    if workers is None or workers <= 1:
+        return None
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_initialize_worker,
+        initargs=(cheight, cdepth, cwidth, prefix_snapshots),
+    )
+
+
+def calculate_fitness_3DContainerLoader(
+    population,
+    packages,
+    cheight,
+    cdepth,
+    cwidth,
+    executor=None,
+    cache=None,
+    prefix_cache=None,
+    keys=None,
+    parents=None,
+    trails=None,
+    cutoff=None,
+):
+    # population holds the package ids of each chromosome in loading order (see PackageGroups.load_orders).
+    # keys are the dimension signatures of the population, parents the signatures of the parents of
+    # each chromosome, and trails maps signatures to their placement trails (see simulate_loading).
+    # With trails, serial evaluations resume from the state of the parent after the runs they share,
+    # and the trails of the new simulations are added.
+    # With a cutoff, simulations that cannot reach it are stopped early and get pruned_fitness(cutoff).
+    if keys is None:
+        keys = PackageGroups(packages).signatures(population)
+    if parents is None:
+        parents = [()] * len(keys)
+    # look up the cached scores and collect the distinct packings that still need a simulation
+    scores = {}
+    to_evaluate = {}
+    for key, parent_keys in zip(keys, parents):
+        if key in scores:
+            if cache is not None:
+                cache.hits += 1
+            continue
+        score = cache.get(key, cutoff) if cache is not None else None
+        if score is None:
+            to_evaluate[key] = parent_keys
+        scores[key] = score
+
+    if executor is None:
+        new_scores = []
+        for key, parent_keys in to_evaluate.items():
+            trail = None
+            if trails is not None:
+                trail = []
+                for parent_key in parent_keys:
+                    if parent_key in trails:
+                        shared_trail = _shared_trail(key, parent_key, trails[parent_key])
+                        if len(shared_trail) > len(trail):
+                            trail = shared_trail
+            new_scores.append(
+                simulate_loading(
+                    key, cheight, cdepth, cwidth, prefix_cache, trail, cutoff
+                )
             )
-            load_box(container, best_row, best_column, depth, width, height)
-        # calculate the fitness score
-        fitness_scores.append(container.depth - best_score)
-    return np.array(fitness_scores)
-
-
-def crossover(parent1, parent2, crossover_rate):
-    child1 = {}
-    child2 = {}
-    for group_id in parent1.keys():
-        if random.random() < crossover_rate:
-            child1[group_id] = parent1[group_id]
-            child2[group_id] = parent2[group_id]
-        else:
-            child1[group_id] = parent2[group_id]
-            child2[group_id] = parent1[group_id]
-    return child1, child2
-
-
-# Perform mutation (swap two random elements)
-def mutate(solution, mutation_rate):
-    mutated_solution = solution.copy()
-    for group_id, group_packages in mutated_solution.items():
-        if random.random() < mutation_rate:  # Mutation probability
-            random.shuffle(group_packages)
-            mutated_solution[group_id] = group_packages
-    return mutated_solution
+            if trail is not None:
+                trails[key] = trail
+    else:
+        # map keeps the order of the signatures, so the scores are the same as in the serial evaluation
+        new_scores = list(
+            executor.map(_evaluate_in_worker, to_evaluate, repeat(cutoff))
+        )
+    for key, score in zip(to_evaluate, new_scores):
+        scores[key] = score
+        if cache is not None:
+            cache.put(key, score, cutoff)
+    return np.array([scores[key] for key in keys])
+
+
+# Pair the parents (0 with 1, 2 with 3, ...) and make two children per pair.
+# The group orders, which decide the packing, are recombined with an order crossover: the first child keeps
+# the groups of the first parent between two random cut points in place, and loads the other groups in the
+# order of the second parent; the second child the other way around.
+# For every group, the first child takes the packages of the first parent with probability crossover_rate and
+# of the second one otherwise, and the second child gets the other parent's. This only changes the packing of
+# groups with boxes of different sizes (see PackageGroups.mixed).
+def crossover(group_orders, package_orders, parent_indices, crossover_rate, groups):
+    first, second = parent_indices[0::2], parent_indices[1::2]
+    number_of_groups = len(groups.group_ids)
+    cuts = np.sort(np.random.randint(number_of_groups + 1, size=(len(first), 2)), axis=1)
+    positions = np.arange(number_of_groups)
+    segment = (positions >= cuts[:, :1]) & (positions < cuts[:, 1:])
+    children_groups = np.empty((2 * len(first), number_of_groups), dtype=group_orders.dtype)
+    children_groups[0::2] = order_crossover(group_orders[first], group_orders[second], segment)
+    children_groups[1::2] = order_crossover(group_orders[second], group_orders[first], segment)
+    from_first = np.random.random((len(first), number_of_groups)) < crossover_rate
+    from_first = from_first[:, groups.column_groups]
+    children = np.empty((2 * len(first), package_orders.shape[1]), dtype=package_orders.dtype)
+    children[0::2] = np.where(from_first, package_orders[first], package_orders[second])
+    children[1::2] = np.where(from_first, package_orders[second], package_orders[first])
+    return children_groups, children
+
+
+# Order crossover of permutations (one per row): the positions in segment keep the genes of keep, and the
+# other positions get the remaining genes in the order of fill
+def order_crossover(keep, fill, segment):
+    kept = np.zeros(keep.shape, dtype=bool)
+    np.put_along_axis(kept, keep, segment, axis=1)
+    children = keep.copy()
+    # boolean indexing goes row by row, so every row gets as many genes as it has free positions
+    children[~segment] = fill[~np.take_along_axis(kept, fill, axis=1)]
+    return children
+
+
+# Perform mutation: shuffle the packages of every group with boxes of different sizes with probability
+# mutation_rate, and swap the loading order of two groups with probability mutation_rate. Shuffling the
+# packages of a group with boxes of one size would keep the packing, so those groups are left alone.
+# The arrays are modified in place.
+def mutate(group_orders, package_orders, mutation_rate, groups):
+    population_size, number_of_groups = group_orders.shape
+    shuffled = (np.random.random((population_size, number_of_groups)) < mutation_rate) & groups.mixed
+    # equal keys keep their order in a stable sort, random keys in [g, g + 1) shuffle group g
+    keys = groups.column_groups + np.where(
+        shuffled[:, groups.column_groups],
+        np.random.random(package_orders.shape),
+        0.0,
+    )
+    package_orders[:] = np.take_along_axis(
+        package_orders, np.argsort(keys, axis=1, kind="stable"), axis=1
+    )
+    if number_of_groups > 1:
+        swap_groups(group_orders, np.flatnonzero(np.random.random(population_size) < mutation_rate))
+    return group_orders, package_orders
+
+
+# Swap the loading order of two random groups (of at least two) in the given rows of group_orders, in place
+def swap_groups(group_orders, rows):
+    number_of_groups = group_orders.shape[1]
+    i = np.random.randint(number_of_groups, size=len(rows))
+    j = (i + np.random.randint(1, number_of_groups, size=len(rows))) % number_of_groups
+    group_orders[rows, i], group_orders[rows, j] = group_orders[rows, j], group_orders[rows, i]
+
+
+# Selection strategies: draw count parent indices from a population with the given fitness scores
+# Select with probabilities proportional to the fitness; chromosomes with a negative fitness (boxes loaded
+# without a feasible position) are never selected, unless no fitness is positive
+def roulette_selection(fitness_scores, count):
+    weights = np.clip(fitness_scores, 0, None)
+    total = np.sum(weights)
+    if total <= 0:
+        return np.random.randint(len(fitness_scores), size=count)
+    return np.random.choice(len(fitness_scores), size=count, p=weights / total)
+
+
+# Select with probabilities proportional to the rank of the fitness (1 for the worst), which keeps the
+# selection pressure when the scores are close to each other
+def rank_selection(fitness_scores, count):
+    ranks = np.empty(len(fitness_scores))
+    ranks[np.argsort(fitness_scores, kind="stable")] = np.arange(1, len(fitness_scores) + 1)
+    return np.random.choice(len(fitness_scores), size=count, p=ranks / np.sum(ranks))
+
+
+# Select the fittest of tournament_size chromosomes drawn at random (with replacement)
+def tournament_selection(fitness_scores, count, tournament_size=3):
+    contestants = np.random.randint(len(fitness_scores), size=(count, tournament_size))
+    winners = np.argmax(np.asarray(fitness_scores)[contestants], axis=1)
+    return contestants[np.arange(count), winners]
+
+
+SELECTION_METHODS = {
+    "roulette": roulette_selection,
+    "rank": rank_selection,
+    "tournament": tournament_selection,
+}
+
+
+# Population of the genetic algorithm in the array encoding (see PackageGroups) with its fitness scores, the
+# signatures of the parents of each chromosome and the best chromosome found so far.
+# The placement trails (see simulate_loading) stay in the process, they are not pickled.
+class Population:
+    def __init__(self, groups, population_size, seeds=None, mutation_rate=0.2):
+        self.groups = groups
+        self.size = population_size
+        self.group_orders, self.package_orders = initialize_population(
+            population_size, groups, seeds, mutation_rate
+        )
+        self.orders = groups.load_orders(self.group_orders, self.package_orders)
+        self.keys = groups.signatures(self.orders)
+        self.fitness_scores = None
+        self.parents = None
+        self.cutoff = None
+        self.generation = 0
+        self.best_chromosome = None
+        self.best_fitness = None
+        self.best_generation = 0
+        self.evaluations = 0
+        self.random_state = None
+        self.trails = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["trails"] = {}
+        return state
+
+    def evaluate(self, fitness):
+        """Compute the fitness scores with fitness(orders, keys, parents, trails, cutoff) and update the best chromosome."""
+        self.fitness_scores = fitness(
+            self.orders, keys=self.keys, parents=self.parents, trails=self.trails, cutoff=self.cutoff
+        )
+        self.evaluations += self.size
+        # pruned scores are below the median of the previous generation, so a best one that improves is exact
+        best_solution_idx = np.argmax(self.fitness_scores)
+        if self.best_fitness is None or self.fitness_scores[best_solution_idx] > self.best_fitness:
+            self.best_chromosome = self.groups.chromosome(
+                self.group_orders[best_solution_idx], self.package_orders[best_solution_idx]
+            )
+            self.best_fitness = self.fitness_scores[best_solution_idx]
+            self.best_generation = self.generation
+
+    def reproduce(self, mutation_rate, prune=False, selection=roulette_selection, elitism=0):
+        """Replace the evaluated population with the next generation, keeping the elitism best chromosomes."""
+        # in pruning mode, simulations stop once they cannot reach the median fitness of the previous
+        # generation; the pruned chromosomes rank below all the others, and the selection still tells the
+        # better half apart (a cutoff at the best fitness would prune almost every child and tie them with it)
+        if prune:
+            self.cutoff = np.median(self.fitness_scores)
+        # only the trails of the current population can serve the next generation
+        self.trails = {key: self.trails[key] for key in self.keys if key in self.trails}
+
+        # the best chromosomes are carried over unchanged
+        elitism = min(elitism, self.size)
+        elite = np.argsort(self.fitness_scores, kind="stable")[::-1][:elitism]
+        children = self.size - elitism
+
+        # Select parents for reproduction, two per pair of children
+        parent_indices = selection(self.fitness_scores, 2 * ((children + 1) // 2))
+
+        # Create new generation
+        group_orders, package_orders = crossover(
+            self.group_orders, self.package_orders, parent_indices, 0.5, self.groups
+        )
+        group_orders, package_orders = mutate(
+            group_orders[:children], package_orders[:children], mutation_rate, self.groups
+        )
+        self.group_orders = np.concatenate((self.group_orders[elite], group_orders))
+        self.package_orders = np.concatenate((self.package_orders[elite], package_orders))
+        # children are re-simulated from the first run of boxes where they differ from their parents
+        pairs = zip(np.repeat(parent_indices[0::2], 2), np.repeat(parent_indices[1::2], 2))
+        self.parents = [(self.keys[index], self.keys[index]) for index in elite] + [
+            (self.keys[first], self.keys[second]) for first, second in pairs
+        ][:children]
+        self.orders = self.groups.load_orders(self.group_orders, self.package_orders)
+        self.keys = self.groups.signatures(self.orders)
+        self.fitness_scores = None
+        self.generation += 1
+
+    def replace(self, indices, other, other_indices):
+        """Replace the chromosomes at indices with evaluated chromosomes of another population."""
+        self.group_orders[indices] = other.group_orders[other_indices]
+        self.package_orders[indices] = other.package_orders[other_indices]
+        self.orders[indices] = other.orders[other_indices]
+        self.fitness_scores[indices] = other.fitness_scores[other_indices]
+        for index, other_index in zip(indices, other_indices):
+            self.keys[index] = other.keys[other_index]
+
+
+# Reason to stop evolving an evaluated population ("generation limit", "time limit", "no improvement",
+# "low diversity" or "stopped", see genetic_algorithm), or None to go on with the next generation
+def _stop_reason(
+    population, num_generations, deadline, stall_generations, min_diversity, should_stop
+):
+    if population.generation >= num_generations:
+        return "generation limit"
+    if deadline is not None and time.time() >= deadline:
+        return "time limit"
+    if (
+        stall_generations is not None
+        and population.generation - population.best_generation >= stall_generations
+    ):
+        return "no improvement"
+    if min_diversity is not None and len(set(population.keys)) < min_diversity * population.size:
+        return "low diversity"
+    if should_stop is not None and should_stop():
+        return "stopped"
+    return None
+
+
+# Evolve a population until generation num_generations, or until it stops early (see genetic_algorithm).
+# The deadline is a time.time() value, on_generation is called after every evaluation with the population and
+# the reason it stops (None if it goes on), and should_stop, if given, is asked before every new generation.
+# Returns the reason it stopped early, or None.
+def evolve(
+    population,
+    num_generations,
+    mutation_rate,
+    fitness,
+    prune=False,
+    deadline=None,
+    stall_generations=None,
+    min_diversity=None,
+    selection=roulette_selection,
+    elitism=0,
+    on_generation=None,
+    should_stop=None,
+):
+    while True:
+        evaluated = population.fitness_scores is None
+        if evaluated:
+            population.evaluate(fitness)
+        reason = _stop_reason(
+            population, num_generations, deadline, stall_generations, min_diversity, should_stop
+        )
+        if evaluated and on_generation is not None:
+            on_generation(population, reason)
+        if reason is not None:
+            return None if reason == "generation limit" else reason
+        population.reproduce(mutation_rate, prune, selection, elitism)
+
+
+# Fitness function of an island worker process, set once by _initialize_island_worker
+_island_fitness = None
+
+
+def _initialize_island_worker(packages, cheight, cdepth, cwidth, prefix_snapshots):
+    global _island_fitness
+    prefix_cache = PrefixCache(prefix_snapshots) if prefix_snapshots > 0 else None
+    _island_fitness = partial(
+        calculate_fitness_3DContainerLoader,
+        packages=packages,
+        cheight=cheight,
+        cdepth=cdepth,
+        cwidth=cwidth,
+        cache=FitnessCache(),
+        prefix_cache=prefix_cache,
+    )
+
+
+# Evolve an island in a worker process with its own random state, so the result does not depend on the
+# process that runs it
+def _evolve_island(
+    population,
+    num_generations,
+    mutation_rate,
+    prune,
+    deadline,
+    stall_generations,
+    min_diversity,
+    selection,
+    elitism,
+):
+    np.random.set_state(population.random_state)
+    reason = evolve(
+        population,
+        num_generations,
+        mutation_rate,
+        _island_fitness,
+        prune,
+        deadline,
+        stall_generations,
+        min_diversity,
+        selection,
+        elitism,
+    )
+    population.random_state = np.random.get_state()
+    return population, reason
+
+
+# Send copies of the best chromosomes of every island to the next one (in a ring), replacing its worst ones
+def migrate(islands, migrants):
+    migrants = min(migrants, min(island.size for island in islands))
+    best = [np.argsort(island.fitness_scores)[::-1][:migrants] for island in islands]
+    senders = [
+        (island, indices) for island, indices in zip(islands[-1:] + islands[:-1], best[-1:] + best[:-1])
+    ]
+    # the senders are copied first, as they also receive migrants
+    senders = [(copy.deepcopy(island), indices) for island, indices in senders]
+    for island, (sender, indices) in zip(islands, senders):
+        worst = np.argsort(island.fitness_scores)[:migrants]
+        island.replace(worst, sender, indices)
+
+
+# Write the state of the genetic algorithm (a dictionary of the populations, the fitness cache, the NumPy
+# random state, ...) to a zlib-compressed pickle, replacing the file atomically. Returns the size in bytes.
+def save_checkpoint(path, state):
+    data = zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    with open(path + ".tmp", "wb") as file:
+        file.write(data)
+    os.replace(path + ".tmp", path)
+    return len(data)
+
+
+def load_checkpoint(path):
+    with open(path, "rb") as file:
+        return pickle.loads(zlib.decompress(file.read()))
+
+
+# Periodic checkpoints of the genetic algorithm: a checkpoint is written at most every interval seconds
+# (or when forced), so the overhead stays bounded; the time spent writing is recorded
+class Checkpointer:
+    def __init__(self, path, interval=60.0):
+        self.path = path
+        self.interval = interval
+        self.count = 0
+        self.seconds = 0.0
+        self.size = 0
+        self._last = time.perf_counter()
+
+    def __call__(self, populations, fitness_cache, generation, stop_reasons, force=False):
+        """Write a checkpoint if the interval has passed since the last one, or if forced."""
+        now = time.perf_counter()
+        if not force and now - self._last < self.interval:
+            return
+        state = {
+            "populations": populations,
+            "fitness_cache": fitness_cache,
+            "generation": generation,
+            "stop_reasons": stop_reasons,
+            "random_state": np.random.get_state(),
+        }
+        self.size = save_checkpoint(self.path, state)
+        self._last = time.perf_counter()
+        self.count += 1
+        self.seconds += self._last - now
+
+    def __str__(self):
+        return f"Checkpoints: {self.count} written in {self.seconds:.3f} s, last {self.size} bytes"
+
+
+# Load a checkpoint to resume from, checking that it was written for the same packages
+def _resume_state(path, groups):
+    state = load_checkpoint(path)
+    for population in state["populations"]:
+        if population.groups.group_ids != groups.group_ids or not np.array_equal(
+            population.groups.package_ids, groups.package_ids
+        ):
+            raise ValueError(f"Checkpoint {path} was written for other packages")
+    np.random.set_state(state["random_state"])
+    return state
+
+
+# Progress of the genetic algorithm after a generation: the best chromosome and fitness over the populations,
+# the number of chromosomes evaluated (cached or not), the seconds since start_time and the reason the search
+# stops (None if it goes on)
+def _progress_report(populations, generation, start_time, stop_reason=None):
+    best = max(populations, key=lambda population: population.best_fitness)
+    return {
+        "generation": generation,
+        "best_fitness": best.best_fitness,
+        "best_chromosome": best.best_chromosome,
+        "evaluations": sum(population.evaluations for population in populations),
+        "elapsed": time.perf_counter() - start_time,
+        "stop_reason": stop_reason,
+    }
+
+
+# Reason an island search stops after a migration (see _stop_reason), or None if it goes on: the generation
+# limit, a stop request, or else the reason of the island with the best chromosome once all have stopped
+def _islands_stop_reason(populations, generation, num_generations, stop_reasons):
+    if generation >= num_generations:
+        return "generation limit"
+    if None in stop_reasons:
+        return None
+    if "stopped" in stop_reasons:
+        return "stopped"
+    best_island = max(range(len(populations)), key=lambda index: populations[index].best_fitness)
+    return stop_reasons[best_island]
 
 
 # Genetic Algorithm
+# The search stops after num_generations, or earlier once time_limit seconds have passed, the best fitness
+# has not improved for stall_generations generations, or less than a fraction min_diversity of the population
+# are distinct packings. It returns the best chromosome found in any generation.
+# With more than one island, independent populations evolve in separate processes and at every multiple of
+# migration_interval generations the best migrants chromosomes of each island replace the worst ones of the
+# next island. Each island evaluates its fitness serially, and stops early on its own.
+# selection is "roulette", "rank", "tournament" (see SELECTION_METHODS) or a function like them, and the
+# elitism best chromosomes of every generation are kept unchanged in the next one.
+# The population can be started from seed chromosomes (see initialize_population).
+# With a checkpoint_path the state is saved there every checkpoint_interval seconds and at the end, and with
+# resume a run continues from the checkpoint (if the file exists) up to num_generations.
+# should_stop is a function without arguments that stops the search (keeping the best so far) when it returns True.
+# progress, if given, is called with a dictionary (see _progress_report) after every generation (after every
+# migration in island mode); the last one tells why the search stopped.
 def genetic_algorithm(
     packages,
     population_size,
@@ -108,52 +871,232 @@ def genetic_algorithm(
     cheight=2670,
     cdepth=13620,
     cwidth=2480,
+    workers=1,
+    fitness_cache=None,
+    prefix_snapshots=1000,
+    prune=False,
+    time_limit=None,
+    stall_generations=None,
+    min_diversity=None,
+    islands=1,
+    migration_interval=10,
+    migrants=2,
+    selection="roulette",
+    elitism=0,
+    seeds=None,
+    checkpoint_path=None,
+    checkpoint_interval=60.0,
+    resume=False,
+    should_stop=None,
+    progress=None,
 ):
-    num_packages = len(packages)
-    population = initialize_population(population_size, packages)
-
-    for generation in range(num_generations):
-        fitness_scores = []
-
-        # set dimensions  of the container
-        fitness_scores = calculate_fitness_3DContainerLoader(
-            population, packages, cheight, cdepth, cwidth
+    start_time = time.perf_counter()
+    if isinstance(selection, str):
+        if selection not in SELECTION_METHODS:
+            raise ValueError(f"Unknown selection method: {selection}")
+        selection = SELECTION_METHODS[selection]
+    deadline = time.time() + time_limit if time_limit is not None else None
+    groups = PackageGroups(packages)
+    checkpointer = Checkpointer(checkpoint_path, checkpoint_interval) if checkpoint_path else None
+    state = None
+    if resume and checkpoint_path and os.path.exists(checkpoint_path):
+        state = _resume_state(checkpoint_path, groups)
+        logger.info("Resuming from generation %d of %s", state["generation"], checkpoint_path)
+    if islands > 1:
+        return _island_genetic_algorithm(
+            groups,
+            packages,
+            population_size,
+            num_generations,
+            mutation_rate,
+            cheight,
+            cdepth,
+            cwidth,
+            prefix_snapshots,
+            prune,
+            deadline,
+            stall_generations,
+            min_diversity,
+            islands,
+            migration_interval,
+            migrants,
+            selection,
+            elitism,
+            seeds,
+            checkpointer,
+            state,
+            should_stop,
+            progress,
+            start_time,
         )
 
-        # Select parents for reproduction using roulette wheel selection
-        probabilities = fitness_scores / np.sum(fitness_scores)
-        parent_indices = np.random.choice(
-            range(population_size), size=population_size, p=probabilities
-        )
+    if state is None:
+        population = Population(groups, population_size, seeds, mutation_rate)
+    else:
+        population = state["populations"][0]
+        fitness_cache = state["fitness_cache"]
+    # evaluate the fitness in a pool of worker processes if more than one worker is requested
+    executor = create_fitness_executor(workers, cheight, cdepth, cwidth, prefix_snapshots)
+    # reuse the scores of chromosomes that were already simulated
+    if fitness_cache is None:
+        fitness_cache = FitnessCache()
+    # and resume new simulations from the longest shared prefix of boxes (kept by each worker in a pool)
+    prefix_cache = PrefixCache(prefix_snapshots) if prefix_snapshots > 0 else None
+    # set dimensions  of the container
+    fitness = partial(
+        calculate_fitness_3DContainerLoader,
+        packages=packages,
+        cheight=cheight,
+        cdepth=cdepth,
+        cwidth=cwidth,
+        executor=executor,
+        cache=fitness_cache,
+        prefix_cache=prefix_cache,
+    )
 
-        parents = [population[index] for index in parent_indices]
+    def on_generation(population, reason):
+        if checkpointer is not None:
+            checkpointer([population], fitness_cache, population.generation, [None])
+        if progress is not None:
+            progress(_progress_report([population], population.generation, start_time, reason))
 
-        # Create new generation
-        new_population = []
-
-        for i in range(0, population_size, 2):
-            parent1, parent2 = parents[i], parents[i + 1]
+    try:
+        stop_reason = evolve(
+            population,
+            num_generations,
+            mutation_rate,
+            fitness,
+            prune,
+            deadline,
+            stall_generations,
+            min_diversity,
+            selection,
+            elitism,
+            on_generation,
+            should_stop,
+        )
+        if checkpointer is not None:
+            checkpointer([population], fitness_cache, population.generation, [stop_reason], force=True)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-            # Perform crossover
-            child1, child2 = crossover(parent1, parent2, 0.5)
-            # Perform mutation
-            child1 = mutate(child1, mutation_rate)
-            child2 = mutate(child2, mutation_rate)
+    logger.info(
+        "Stopped after %d generations (%s), best found in generation %d",
+        population.generation,
+        stop_reason or "generation limit",
+        population.best_generation,
+    )
+    logger.info("Fitness cache hits: %d misses: %d", fitness_cache.hits, fitness_cache.misses)
+    if prefix_cache is not None and executor is None:
+        logger.info("Prefix cache hits: %d misses: %d", prefix_cache.hits, prefix_cache.misses)
+    if checkpointer is not None:
+        logger.info("%s", checkpointer)
 
-            new_population.extend([child1, child2])
+    return population.best_chromosome, population.best_fitness
 
-        population = np.array(new_population)
 
-    # Find the best solution from the final generation
-    fitness_scores = []
+def _island_genetic_algorithm(
+    groups,
+    packages,
+    population_size,
+    num_generations,
+    mutation_rate,
+    cheight,
+    cdepth,
+    cwidth,
+    prefix_snapshots,
+    prune,
+    deadline,
+    stall_generations,
+    min_diversity,
+    islands,
+    migration_interval,
+    migrants,
+    selection,
+    elitism,
+    seeds,
+    checkpointer,
+    state,
+    should_stop,
+    progress,
+    start_time,
+):
+    if state is None:
+        populations = []
+        for _ in range(islands):
+            population = Population(groups, population_size, seeds, mutation_rate)
+            population.random_state = np.random.RandomState(np.random.randint(2**31)).get_state()
+            populations.append(population)
+        stop_reasons = [None] * islands
+        generation = 0
+    else:
+        populations = state["populations"]
+        stop_reasons = state["stop_reasons"]
+        generation = state["generation"]
+        islands = len(populations)
 
-    # set dimensions  of the container
-    fitness_scores = calculate_fitness_3DContainerLoader(
-        population, packages, cheight, cdepth, cwidth
+    executor = ProcessPoolExecutor(
+        max_workers=islands,
+        initializer=_initialize_island_worker,
+        initargs=(packages, cheight, cdepth, cwidth, prefix_snapshots),
     )
-    best_solution_idx = np.argmax(fitness_scores)
-    best_chromosome = population[best_solution_idx]
-
-    best_fitness = fitness_scores[best_solution_idx]
+    try:
+        while generation < num_generations and None in stop_reasons:
+            active = [index for index in range(islands) if stop_reasons[index] is None]
+            # the epochs end at the multiples of migration_interval, so a run resumed from a checkpoint
+            # migrates at the same generations as one that was not interrupted
+            generation = min((generation // migration_interval + 1) * migration_interval, num_generations)
+            futures = [
+                executor.submit(
+                    _evolve_island,
+                    populations[index],
+                    generation,
+                    mutation_rate,
+                    prune,
+                    deadline,
+                    stall_generations,
+                    min_diversity,
+                    selection,
+                    elitism,
+                )
+                for index in active
+            ]
+            for index, future in zip(active, futures):
+                populations[index], stop_reasons[index] = future.result()
+            # the migration is done before the checkpoint, also at the last generation, so the checkpointed
+            # populations are those a longer run continues from
+            if generation % migration_interval == 0:
+                migrate(populations, migrants)
+            # the islands are asked to stop between migrations
+            if (
+                generation < num_generations
+                and None in stop_reasons
+                and should_stop is not None
+                and should_stop()
+            ):
+                stop_reasons = [reason or "stopped" for reason in stop_reasons]
+            if checkpointer is not None:
+                checkpointer(populations, None, generation, stop_reasons)
+            if progress is not None:
+                stop_reason = _islands_stop_reason(
+                    populations, generation, num_generations, stop_reasons
+                )
+                progress(_progress_report(populations, generation, start_time, stop_reason))
+        if checkpointer is not None:
+            checkpointer(populations, None, generation, stop_reasons, force=True)
+    finally:
+        executor.shutdown()
 
-    return best_chromosome, best_fitness
+    best_island = max(range(islands), key=lambda index: populations[index].best_fitness)
+    for index, population in enumerate(populations):
+        logger.info(
+            "Island %d stopped after %d generations (%s), best fitness %s",
+            index,
+            population.generation,
+            stop_reasons[index] or "generation limit",
+            population.best_fitness,
+        )
+    if checkpointer is not None:
+        logger.info("%s", checkpointer)
+    return populations[best_island].best_chromosome, populations[best_island].best_fitness
@@ -0,0 +1,174 @@
+# Description: Local background queue for the container loading jobs of the web application.
+# The jobs run in a process pool, so a long computation does not block the server, and at most max_jobs of them
+# run at the same time (the others wait in the queue). A running job is stopped (keeping its best result) or
+# cancelled through a request shared with its process, which the genetic algorithm checks between generations,
+# and it shares its progress after every generation: the entries of the new generations go through a queue, and
+# the server appends them to the histories of the jobs, so every generation is only sent once.
+# The queue is local to the server process: with several server processes, every one has its own jobs.
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import Manager
+import logging
+import queue
+import uuid
+
+from container_loading_metaheuristic import container_loading
+
+logger = logging.getLogger(__name__)
+
+
+# Run a job in a worker process; returns its result (None if it was cancelled) and the number of hits and
+# misses of its copy of the result cache, if any.
+# The pool hands a job to a process before one is free, so the job marks itself as started
+def _run_job(job_id, started, requests, progress, layouts, json_container, json_delivery, options):
+    def stop_requested():
+        return job_id in requests
+
+    shared_layout = [None]
+
+    def report_progress(report):
+        # (generation, loading length, evaluations, elapsed seconds) of the generation
+        progress.put(
+            (
+                job_id,
+                (
+                    report["generation"],
+                    float(report["loading_length"]),
+                    report["evaluations"],
+                    report["elapsed"],
+                ),
+            )
+        )
+        if report["boxes_json"] is not shared_layout[0]:
+            shared_layout[0] = report["boxes_json"]
+            layouts[job_id] = report["boxes_json"]
+
+    if stop_requested():
+        return None, 0, 0
+    started[job_id] = True
+    result_cache = options.get("result_cache")
+    cache_counts = (result_cache.hits, result_cache.misses) if result_cache is not None else (0, 0)
+    result = container_loading(
+        json_container,
+        json_delivery,
+        should_stop=stop_requested,
+        progress=report_progress,
+        **options,
+    )
+    if result_cache is not None:
+        cache_counts = (result_cache.hits - cache_counts[0], result_cache.misses - cache_counts[1])
+    else:
+        cache_counts = (0, 0)
+    return (None if requests.get(job_id) == "cancel" else result), *cache_counts
+
+
+# Add the result cache hits and misses of a finished job to the result cache of the server and log them
+def _count_result_cache(result_cache, future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    _, hits, misses = future.result()
+    result_cache.hits += hits
+    result_cache.misses += misses
+    logger.info("Result cache hits: %d misses: %d", result_cache.hits, result_cache.misses)
+
+
+class JobQueue:
+    def __init__(self, max_jobs=2, max_finished=100):
+        self.max_jobs = max_jobs
+        self.max_finished = max_finished
+        self._executor = None
+        self._started = None
+        self._requests = None
+        self._progress = None
+        self._layouts = None
+        self._histories = {}
+        self._jobs = OrderedDict()
+
+    def submit(self, json_container, json_delivery, **options):
+        """Queue a container loading job (options as in container_loading) and return its id."""
+        if self._executor is None:
+            # started on the first job, so importing the application does not start any processes
+            self._executor = ProcessPoolExecutor(max_workers=self.max_jobs)
+            manager = Manager()
+            self._started = manager.dict()
+            self._requests = manager.dict()
+            self._progress = manager.Queue()
+            self._layouts = manager.dict()
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = self._executor.submit(
+            _run_job,
+            job_id,
+            self._started,
+            self._requests,
+            self._progress,
+            self._layouts,
+            json_container,
+            json_delivery,
+            options,
+        )
+        if options.get("result_cache") is not None:
+            # the job works on a copy of the result cache, which only it counts
+            self._jobs[job_id].add_done_callback(partial(_count_result_cache, options["result_cache"]))
+        self._forget_finished()
+        return job_id
+
+    def status(self, job_id):
+        """Get the state of a job ("unknown", "queued", "running", "cancelled", "failed" or "done") and its
+        result (the JSON of the boxes) or error message."""
+        future = self._jobs.get(job_id)
+        if future is None:
+            return "unknown", None
+        if future.cancelled():
+            return "cancelled", None
+        if not future.done():
+            return ("running" if job_id in self._started else "queued"), None
+        if future.exception() is not None:
+            return "failed", str(future.exception())
+        result, _, _ = future.result()
+        if result is None:
+            return "cancelled", None
+        return "done", result
+
+    def progress(self, job_id):
+        """Get the (generation, loading length, evaluations, elapsed seconds) of every generation of a job so
+        far, and the boxes of its best loading in JSON format (or None)."""
+        if job_id not in self._jobs:
+            return [], None
+        self._receive_progress()
+        return list(self._histories.get(job_id, [])), self._layouts.get(job_id)
+
+    def _receive_progress(self):
+        while True:
+            try:
+                job_id, entry = self._progress.get_nowait()
+            except queue.Empty:
+                return
+            if job_id in self._jobs:
+                self._histories.setdefault(job_id, []).append(entry)
+
+    def stop(self, job_id):
+        """Ask a running job to stop and keep the best result it has found; a queued job is cancelled."""
+        self._request(job_id, "stop")
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or ask a running one to stop without a result."""
+        self._request(job_id, "cancel")
+
+    def _request(self, job_id, request):
+        future = self._jobs.get(job_id)
+        if future is None or future.done():
+            return
+        if not future.cancel():
+            self._requests[job_id] = request
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, future in self._jobs.items() if future.done()]
+        for job_id in finished[: max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+            for shared in (self._started, self._requests, self._layouts, self._histories):
+                shared.pop(job_id, None)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
@@ -1,11 +1,34 @@
 from utils import read_excel
 from container_loading_metaheuristic import container_loading
+from result_cache import ResultCache
+import logging
+import os
 import sys
 
 
 if __name__ == "__main__":
+    # show the statistics the genetic algorithm logs
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # optional checkpointing of the genetic algorithm: --checkpoint file [--resume]
+    checkpoint_path = None
+    resume = "--resume" in sys.argv
+    if resume:
+        sys.argv.remove("--resume")
+    if "--checkpoint" in sys.argv:
+        index = sys.argv.index("--checkpoint")
+        checkpoint_path = sys.argv[index + 1]
+        del sys.argv[index : index + 2]
+    # optional result cache: --cache directory (a relative directory is taken from the directory of this script)
+    cache_directory = None
+    if "--cache" in sys.argv:
+        index = sys.argv.index("--cache")
+        cache_directory = sys.argv[index + 1]
+        del sys.argv[index : index + 2]
     if len(sys.argv) != 4:
-        print("Usage: python script.py excel_file container_sheet items_sheet")
+        print(
+            "Usage: python script.py excel_file container_sheet items_sheet "
+            "[--checkpoint file [--resume]] [--cache directory]"
+        )
         print("Using sample from Sample_data0.xlsx")
         excel_file_path = "Sample_data0.xlsx"
         sheet_container = "Container"
@@ -21,6 +44,17 @@ if __name__ == "__main__":
     data_container = read_excel(excel_file_path, sheet_container)
     data_delivery = read_excel(excel_file_path, sheet_items_d1)
 
-    result = container_loading(data_container.to_json(), data_delivery.to_json())
+    result_cache = None
+    if cache_directory is not None:
+        result_cache = ResultCache(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), cache_directory)
+        )
+    result = container_loading(
+        data_container.to_json(),
+        data_delivery.to_json(),
+        checkpoint_path=checkpoint_path,
+        resume=resume,
+        result_cache=result_cache,
+    )
 
     print(result)
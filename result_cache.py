@@ -0,0 +1,76 @@
+# Description: Persistent cache of container loading results on disk.
+# The results are content addressed: every result is stored in a file named after a hash of the normalised input
+# data and solver parameters. The files of the least recently used results are deleted once the cache holds
+# more than max_bytes (a hit updates the modification time of its file).
+import hashlib
+import json
+import os
+
+
+class ResultCache:
+    def __init__(self, directory="result_cache", max_bytes=100 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, *parts):
+        """Get the key of a result from its JSON serialisable inputs."""
+        text = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """Get a cached result, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path) as file:
+                result = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Store a result, replacing the file atomically, and evict the least recently used results."""
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as file:
+            file.write(result)
+        os.replace(temporary_path, path)
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __str__(self):
+        return f"ResultCache(size={len(self)}, hits={self.hits}, misses={self.misses})"
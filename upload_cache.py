@@ -0,0 +1,40 @@
+# Description: Server-side store of the workbooks uploaded to the web application.
+# Every upload is parsed once into a DataFrame per sheet and kept under an upload id, so only ids travel
+# between the browser and the server. The store is bounded by the memory used by the DataFrames, and the least
+# recently used uploads are dropped first.
+# The store is local to the server process: with several server processes, every one has its own uploads.
+from collections import OrderedDict
+import threading
+import uuid
+
+
+class UploadCache:
+    def __init__(self, max_bytes=200 * 2**20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._uploads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, sheets):
+        """Store the DataFrames of the sheets of an upload (by sheet name) and return its id."""
+        upload_id = uuid.uuid4().hex
+        size = sum(int(sheet.memory_usage(deep=True).sum()) for sheet in sheets.values())
+        with self._lock:
+            self._uploads[upload_id] = (sheets, size)
+            self.size += size
+            # the newest upload is kept even if it is larger than max_bytes on its own
+            while self.size > self.max_bytes and len(self._uploads) > 1:
+                _, (_, dropped_size) = self._uploads.popitem(last=False)
+                self.size -= dropped_size
+        return upload_id
+
+    def get(self, upload_id):
+        """Get the DataFrames of the sheets of an upload, or None if it is unknown or was dropped."""
+        with self._lock:
+            if upload_id not in self._uploads:
+                return None
+            self._uploads.move_to_end(upload_id)
+            return self._uploads[upload_id][0]
+
+    def __len__(self):
+        return len(self._uploads)